@@ -1,10 +1,12 @@
 import logging
+import mimetypes
+import stat
 from pathlib import Path
 from typing import List, Dict, Any
 
 # Import Depends for dependency injection
 from fastapi import APIRouter, HTTPException, Request, Query, Depends, status
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 
 from app.core.config import settings
 from app.services.video.frame_processor import FrameProcessor
@@ -14,39 +16,62 @@ from app.main import get_frame_processor
 
 logger = logging.getLogger(__name__)
 
+# Settings are frozen; bind the values used per request once instead of going through the model each hit
+_FRAMES_DIR = settings.FRAMES_DIR_RESOLVED
+_USE_XACCEL = settings.USE_XACCEL
+_XACCEL_FRAMES_LOCATION = settings.XACCEL_FRAMES_LOCATION.rstrip('/')
+_DEFAULT_TOP_K = settings.DEFAULT_TOP_K
+_MAX_TOP_K = settings.MAX_TOP_K
+
 router = APIRouter()
 
 # Moved frame serving endpoint under API
 @router.get("/frames/{frame_path:path}", include_in_schema=False)
-async def get_frame(frame_path: str) -> FileResponse:
+async def get_frame(frame_path: str) -> Response:
     """Serve a frame image by its relative path within the static/frames directory."""
-    # Use path from settings
-    base_static_frames_dir = (settings.STATIC_DIR / "frames").resolve()
-    expected_path = base_static_frames_dir / frame_path
+    # Use the frames dir resolved once at startup
+    expected_path = _FRAMES_DIR / frame_path
 
-    try:
-        # Resolve the path to prevent directory traversal
-        full_path = expected_path.resolve()
+    # Resolve the path to prevent directory traversal
+    full_path = expected_path.resolve()
+
+    # Security check: Ensure the resolved path is within the intended directory (component-wise)
+    if not full_path.is_relative_to(_FRAMES_DIR):
+        logger.warning(f"Attempted access outside of frames directory: {frame_path}")
+        raise HTTPException(status_code=404, detail="Frame not found")
 
-        # Security check: Ensure the resolved path is within the intended directory
-        if not str(full_path).startswith(str(base_static_frames_dir)):
-             logger.warning(f"Attempted access outside of frames directory: {frame_path}")
-             raise FileNotFoundError("Invalid path")
+    if _USE_XACCEL:
+        # Hand the byte transfer to the proxy (sendfile); Nginx answers 404 itself if missing
+        relative_path = full_path.relative_to(_FRAMES_DIR).as_posix()
+        return Response(
+            status_code=200,
+            headers={
+                "X-Accel-Redirect": f"{_XACCEL_FRAMES_LOCATION}/{relative_path}",
+                "Content-Type": mimetypes.guess_type(relative_path)[0] or "application/octet-stream",
+            },
+        )
 
-        if full_path.exists() and full_path.is_file():
-            return FileResponse(str(full_path))
-        else:
-            raise FileNotFoundError("Frame file not found")
-    except FileNotFoundError as e:
-        logger.warning(f"Frame not found: {frame_path} ({e})")
+    # A single stat answers both "exists" and "is a regular file", and is reused by FileResponse
+    try:
+        stat_result = full_path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        logger.debug("Frame not found: %s", frame_path)
         raise HTTPException(status_code=404, detail="Frame not found")
-    except Exception as e:
+    except OSError as e:
         logger.error(f"Error serving frame {frame_path}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error serving frame")
 
+    if not stat.S_ISREG(stat_result.st_mode):
+        logger.debug("Frame path is not a regular file: %s", frame_path)
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    return FileResponse(str(full_path), stat_result=stat_result)
+
 @router.get(
     "/search", 
+    # ApiResponse documents the schema; the handler returns pre-built JSON and skips per-item validation
     response_model=ApiResponse,
+    response_class=ORJSONResponse,
     responses={
         400: {
             "description": "Bad Request - Invalid input parameters",
@@ -75,17 +100,17 @@ async def get_frame(frame_path: str) -> FileResponse:
     },
     openapi_extra={"x-no-422": True}  # Custom hint to remove 422 from schema
 )
-def search(
+async def search(
     query: str = Query(..., min_length=1, description="Text query to search for in video frames"),
-    top_k: int = Query(default=settings.DEFAULT_TOP_K,
-                       ge=1, le=settings.MAX_TOP_K,
+    top_k: int = Query(default=_DEFAULT_TOP_K,
+                       ge=1, le=_MAX_TOP_K,
                        description="Number of results to return"),
     frame_processor: FrameProcessor = Depends(get_frame_processor)
-) -> ApiResponse:
+) -> ORJSONResponse:
     """Search for frames matching the query text."""
     
-    logger.info(f"Processing search query: '{query}' with top_k={top_k}")
-    search_results = frame_processor.search_frames(query, top_k=top_k)
+    logger.debug("Processing search query: %r top_k=%d", query, top_k)
+    search_results = await frame_processor.search_frames_async(query, top_k=top_k)
     
-    # Return results
-    return ApiResponse(results=search_results["results"]) 
\ No newline at end of file
+    # Return results (already shaped like ApiResponse by FrameProcessor)
+    return ORJSONResponse({"results": search_results["results"]}) 
\ No newline at end of file
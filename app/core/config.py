@@ -2,7 +2,7 @@ import torch
 from pathlib import Path
 # Use BaseSettings for environment variable loading
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Literal
 import os
 import logging # For ensure_configured_dirs
 
@@ -16,7 +16,8 @@ BASE_DIR = Path(PROJECT_ROOT_ENV).resolve() if PROJECT_ROOT_ENV else Path(__file
 class Settings(BaseSettings):
     """Application Configuration using Pydantic BaseSettings."""
     # Load from .env file first, then environment variables. Ignore extras.
-    model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore')
+    # Frozen: settings never change after startup, so modules may bind values to constants at import time
+    model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore', frozen=True)
 
     # --- Base Paths ---
     # Allow overriding via environment variables if needed, default relative to BASE_DIR
@@ -33,6 +34,12 @@ class Settings(BaseSettings):
     # --- Model Configuration ---
     CLIP_MODEL_NAME: str = "openai/clip-vit-large-patch14"
     EMBEDDING_DIM: int = 768 # Tied to CLIP_MODEL_NAME, update if model changes
+    USE_TRT: bool = False  # Run the CLIP image encoder through a TensorRT engine (video processing, CUDA only)
+    TRT_ENGINE_PATH: Path = DATA_DIR / "clip_vision.plan"  # Built with scripts/export_clip_trt.py
+    CLIP_COMPILE: bool = False # torch.compile the CLIP encoders (slower startup, faster steady-state)
+    CLIP_CUDA_GRAPH: bool = False # Replay CUDA graphs captured at BATCH_SIZE for image embeddings (CUDA only, not with CLIP_COMPILE)
+    CLIP_CUDA_GRAPH_STREAMS: int = 1 # Streams (one captured graph each) that concurrent callers round-robin over; each holds BATCH_SIZE activations
+    CLIP_MODEL_CACHE_SIZE: int = 2 # Loaded CLIP models kept in memory; the least recently used is evicted
 
     # --- Device Configuration ---
     FORCE_CPU: bool = False
@@ -41,12 +48,26 @@ class Settings(BaseSettings):
     # --- Frame Processing ---
     FRAME_EXTRACTION_FPS: float = 10.0
     BATCH_SIZE: int = 32
+    VIDEO_DECODER: Literal["auto", "pyav", "opencv"] = "auto"  # 'auto' uses PyAV when installed
+    VIDEO_HWACCEL: Optional[str] = "cuda"  # PyAV hardware decoder ('cuda', 'vaapi', ...); None decodes on CPU
+    FRAME_JPEG_QUALITY: int = 95  # Quality of saved frame JPEGs
+    FRAME_SAVE_THREADS: int = 4   # Threads encoding/writing frames while the GPU embeds the next batch
+    CHECKPOINT_EVERY_N_VIDEOS: int = 0  # Save the index in the background every N processed videos (0 = only at the end)
+    NUM_DECODE_WORKERS: int = 1  # Processes decoding videos in parallel; CLIP/FAISS stay in the main process
 
     # --- Duplicate Detection ---
     SIMILARITY_THRESHOLD: float = 0.95  # For CLIP embedding similarity
     HASH_THRESHOLD: int = 5            # Max difference for phash
     WINDOW_SIZE: int = 10              # Recent embeddings check window
     LSH_BITS: int = 128                # FAISS LSH bits (if LSH is used)
+    DEDUP_GPU_MAX_VECTORS: int = 1_000_000  # Duplicate-detection index moves from GPU to CPU above this size
+
+    # --- FAISS Index ---
+    FAISS_STORAGE_DTYPE: Literal["fp32", "fp16"] = "fp16"  # Precision of vectors in the exact (Flat) index
+    FAISS_IVF_FACTORY: str = "IVF4096,PQ64x8"  # Compressed index used once the corpus is large
+    FAISS_IVF_MIN_VECTORS: int = 200_000       # Stay on exact Flat search below this many vectors
+    FAISS_NPROBE: int = 16                     # IVF buckets scanned per query
+    FAISS_MMAP_INDEX: bool = True              # Memory-map index.faiss on load instead of reading it into RAM
 
     # --- Video Processing Script ---
     ALLOWED_VIDEO_EXTENSIONS: List[str] = ['.mp4', '.avi', '.mov']
@@ -54,29 +75,47 @@ class Settings(BaseSettings):
     # --- API Configuration ---
     API_HOST: str = "127.0.0.1"
     API_PORT: int = 8000
+    # Each worker process loads its own CLIP model; the FAISS index pages are shared when memory-mapped
+    API_WORKERS: int = 1
     # BASE_URL will be determined dynamically
     # ALLOWED_HOSTS should be set restrictively in production via env var
     # Example: ALLOWED_HOSTS='["https://yourdomain.com", "https://www.yourdomain.com"]'
     ALLOWED_HOSTS: List[str] = ["*"] # Default allows all, CHANGE FOR PROD
+    # Let a reverse proxy (Nginx) send frame files: the API only answers with an
+    # X-Accel-Redirect header and /static is no longer mounted by the app
+    USE_XACCEL: bool = False
+    XACCEL_FRAMES_LOCATION: str = "/_protected_frames/" # Internal Nginx location aliased to FRAMES_DIR
 
     # --- API Query Defaults ---
     DEFAULT_TOP_K: int = 4
     MAX_TOP_K: int = 10
 
+    # --- Search Micro-Batching ---
+    SEARCH_BATCH_MAX_SIZE: int = 32          # Max concurrent queries encoded/searched together
+    SEARCH_BATCH_MAX_LATENCY_MS: float = 10.0  # Max time a query waits for others to join its batch
+    TEXT_EMBEDDING_CACHE_SIZE: int = 4096    # Query embeddings kept in the LRU cache (0 disables it)
+    # Known common queries (e.g. UI suggestion chips) embedded once at startup and never evicted
+    # Example: POPULAR_QUERIES='["person walking", "dog playing fetch"]'
+    POPULAR_QUERIES: List[str] = []
+
     # --- Dynamic Attributes (Set after loading) ---
     CLIP_DEVICE: str = "cpu" # Initialize default
     BASE_URL: str = ""       # Initialize default
+    FRAMES_DIR_RESOLVED: Path = Path() # Absolute, symlink-free frames dir served by the API
 
     # Pydantic v2 way to run logic after validation/loading
     def __init__(self, **values):
         super().__init__(**values)
+        # The model is frozen, so derived values are written once here past the frozen check
         # Determine device
         if torch.cuda.is_available() and not self.FORCE_CPU:
-            self.CLIP_DEVICE = "cuda"
+            object.__setattr__(self, "CLIP_DEVICE", "cuda")
         else:
-            self.CLIP_DEVICE = "cpu"
+            object.__setattr__(self, "CLIP_DEVICE", "cpu")
         # Set Base URL
-        self.BASE_URL = f"http://{self.API_HOST}:{self.API_PORT}"
+        object.__setattr__(self, "BASE_URL", f"http://{self.API_HOST}:{self.API_PORT}")
+        # Resolve once here instead of a realpath() on every frame request
+        object.__setattr__(self, "FRAMES_DIR_RESOLVED", (self.STATIC_DIR / "frames").resolve())
 
 # Instantiate settings - This single instance will be imported elsewhere
 settings = Settings()
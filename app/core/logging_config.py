@@ -0,0 +1,33 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def configure_logging(level: int = logging.INFO) -> QueueListener:
+    """
+    Configure the root logger to hand records to a queue drained by a listener thread.
+
+    Request handlers only enqueue records; formatting and the write to stderr
+    happen on the listener thread, so handlers never contend on the stream lock.
+
+    Args:
+        level: Root log level
+
+    Returns:
+        The started QueueListener (stopped automatically at interpreter exit)
+    """
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [QueueHandler(log_queue)]
+    root_logger.setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
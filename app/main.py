@@ -5,7 +5,7 @@ import logging
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, Depends, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
@@ -15,18 +15,17 @@ import torch # For device check
 
 # Configuration
 from app.core.config import settings, ensure_configured_dirs
+from app.core.logging_config import configure_logging
 
 # Services and Utilities (Import types needed for getters first)
 from app.services.search.faiss_service import FAISSService, FAISSServiceError
+from app.services.search.batcher import SearchBatcher
 from app.services.video.frame_processor import FrameProcessor
 from app.utils.model_utils import load_clip_model
 from app.utils.error_handling import VideoProcessingError
 
-# Configure logging (move comprehensive config elsewhere if needed)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-)
+# Configure logging (records are written by a background listener thread)
+configure_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Define State and Dependency Getters FIRST --- #
@@ -74,10 +73,23 @@ async def lifespan(app: FastAPI):
         app_state["faiss_service"] = faiss_service
         logger.info("FAISS service initialized.")
 
+        # Embed known popular queries up front so they never hit CLIP at request time
+        faiss_service.precompute_query_embeddings(settings.POPULAR_QUERIES)
+
+        # Start the search micro-batcher (coalesces concurrent queries)
+        search_batcher = SearchBatcher(
+            faiss_service=faiss_service,
+            max_batch_size=settings.SEARCH_BATCH_MAX_SIZE,
+            max_latency_ms=settings.SEARCH_BATCH_MAX_LATENCY_MS
+        )
+        search_batcher.start()
+        app_state["search_batcher"] = search_batcher
+
         # Initialize FrameProcessor
         frame_processor = FrameProcessor(
             faiss_service=faiss_service,
-            base_url=settings.BASE_URL
+            base_url=settings.BASE_URL,
+            search_batcher=search_batcher
         )
         app_state["frame_processor"] = frame_processor
         logger.info("Frame processor initialized.")
@@ -92,6 +104,8 @@ async def lifespan(app: FastAPI):
 
     # Cleanup happens after yield (if needed)
     logger.info("Application shutdown: Cleaning up resources...")
+    if "search_batcher" in app_state:
+        await app_state["search_batcher"].stop()
     app_state.clear()
 
 # Create FastAPI app with lifespan manager
@@ -99,6 +113,7 @@ app = FastAPI(
     title="Video Frame Search API",
     description="API for searching video frames using CLIP embeddings",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -188,8 +203,9 @@ app.add_middleware(
 
 # --- Static Files --- #
 
-# Mount static files directory using settings
-app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
+# Mount static files directory using settings (the reverse proxy serves it when USE_XACCEL is on)
+if not settings.USE_XACCEL:
+    app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 
 # --- Routers --- #
 
@@ -231,6 +247,9 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.API_HOST,
         port=settings.API_PORT,
+        workers=settings.API_WORKERS,
+        loop="uvloop",      # libuv event loop (installed with uvicorn[standard])
+        http="httptools",   # C HTTP parser (installed with uvicorn[standard])
         reload=False,
-        log_level=logging.INFO
+        log_level="warning"
     ) 
\ No newline at end of file
@@ -2,24 +2,24 @@
 
 import argparse
 import logging
+import os
 import sys
 from pathlib import Path
-import torch # Needed for device check
-from typing import Tuple
-from transformers import CLIPModel, CLIPProcessor # Import types used in Tuple
+from typing import TYPE_CHECKING, Tuple
 
 # Remove sys.path manipulation - Run as a module or set PYTHONPATH
 # project_root = str(Path(__file__).parent.parent)
 # if project_root not in sys.path:
 #     sys.path.append(project_root)
 
-# Import necessary components
-from app.services.video.processor import VideoProcessor
-from app.services.search.faiss_service import FAISSService
+# Import necessary components. torch, transformers, FAISS and the processor are imported
+# inside the functions that use them: decode workers are spawned processes, and spawn
+# re-imports this module in every worker, which should only pay for decoding.
 from app.utils.error_handling import VideoProcessingError, FAISSServiceError
-from app.utils.model_utils import load_clip_model
-# Import the centralized settings object and dir creator
-from app.core.config import settings, ensure_configured_dirs
+
+if TYPE_CHECKING:
+    from transformers import CLIPModel, CLIPProcessor
+    from app.services.search.faiss_service import FAISSService
 
 # Configure logging (basic setup)
 logging.basicConfig(
@@ -29,6 +29,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def parse_args():
+    from app.core.config import settings
+
     parser = argparse.ArgumentParser(description='Process videos to create frame embeddings')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Enable verbose output')
@@ -39,11 +41,19 @@ def parse_args():
                         help=f'Directory containing videos to process (default: {settings.VIDEO_DIR})')
     parser.add_argument('--extensions', nargs='+', default=settings.ALLOWED_VIDEO_EXTENSIONS,
                         help=f'List of allowed video extensions (default: {settings.ALLOWED_VIDEO_EXTENSIONS})')
+    parser.add_argument('--workers', type=int, default=settings.NUM_DECODE_WORKERS,
+                        help=f'Processes decoding videos in parallel; embedding stays in the main process '
+                             f'(default: settings.NUM_DECODE_WORKERS={settings.NUM_DECODE_WORKERS}, '
+                             f'e.g. {max(1, (os.cpu_count() or 2) // 2)} for half the CPU cores)')
 
     return parser.parse_args()
 
-def setup_dependencies(device_override: str) -> Tuple[CLIPModel, CLIPProcessor, FAISSService]:
+def setup_dependencies(device_override: str) -> Tuple["CLIPModel", "CLIPProcessor", "FAISSService"]:
     """Load models and initialize services based on the chosen device."""
+    from app.core.config import settings
+    from app.services.search.faiss_service import FAISSService
+    from app.utils.model_utils import load_clip_model
+
     logger.info(f"Setting up dependencies for device: {device_override}")
     try:
         # Load CLIP model using settings name and overridden device
@@ -62,6 +72,8 @@ def setup_dependencies(device_override: str) -> Tuple[CLIPModel, CLIPProcessor,
 
 def run_processing(args, device_to_use: str) -> int:
     """Runs the video processing workflow with the specified device."""
+    from app.services.video.processor import VideoProcessor
+
     try:
         clip_model, clip_processor, faiss_service = setup_dependencies(device_to_use)
 
@@ -80,7 +92,8 @@ def run_processing(args, device_to_use: str) -> int:
         # Pass overrides to process_all_videos
         processor.process_all_videos(
             video_dir_override=arg_video_dir,
-            allowed_extensions_override=allowed_extensions
+            allowed_extensions_override=allowed_extensions,
+            num_workers_override=max(1, args.workers)
         )
 
         # Finalize (Save index)
@@ -97,6 +110,9 @@ def run_processing(args, device_to_use: str) -> int:
         return 1 # Indicate failure
 
 def main():
+    import torch # Needed for device check
+    from app.core.config import settings, ensure_configured_dirs
+
     args = parse_args()
 
     # Call dir creator function
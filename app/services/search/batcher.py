@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.services.search.faiss_service import FAISSService
+from app.utils.error_handling import FAISSServiceError
+
+logger = logging.getLogger(__name__)
+
+# (query, top_k, future resolved with that query's results)
+_PendingSearch = Tuple[str, int, asyncio.Future]
+
+class SearchBatcher:
+    """Coalesce concurrent search requests into one CLIP forward pass and one FAISS search."""
+
+    def __init__(self, faiss_service: FAISSService, max_batch_size: int, max_latency_ms: float):
+        """
+        Initialize the batcher.
+
+        Args:
+            faiss_service: Service used to run the batched search
+            max_batch_size: Maximum number of queries searched together
+            max_latency_ms: How long the first queued query waits for others to join its batch
+        """
+        self.faiss_service = faiss_service
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background worker (must be called from a running event loop)."""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Search batcher started (max_batch_size={self.max_batch_size}, "
+                    f"max_latency={self.max_latency * 1000:.1f}ms)")
+
+    async def stop(self) -> None:
+        """Cancel the background worker."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def submit(self, query: str, top_k: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Queue a query and wait for its share of the next batch."""
+        if self._worker is None:
+            raise FAISSServiceError("Search batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[_PendingSearch] = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch: List[_PendingSearch]) -> None:
+        queries = [query for query, _, _ in batch]
+        # Results are ranked, so searching once with the largest top_k serves every request
+        max_top_k = max(top_k for _, top_k, _ in batch)
+        logger.debug("Dispatching search batch of %d queries (top_k=%d)", len(batch), max_top_k)
+        try:
+            batch_results = await asyncio.get_running_loop().run_in_executor(
+                None, self.faiss_service.search_batch, queries, max_top_k
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, top_k, future), result in zip(batch, batch_results):
+            # The request may have been cancelled (e.g. client disconnected) while waiting
+            if not future.done():
+                future.set_result({"results": result["results"][:top_k]})
@@ -1,12 +1,18 @@
 import faiss
 import numpy as np
-import json
+import orjson
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from app.core.config import settings
+from app.services.search.metadata_store import FrameMetadataStore
 from app.utils.error_handling import FAISSServiceError, handle_faiss_errors
-from app.utils.model_utils import generate_text_embedding, load_clip_model
+from app.utils.file_ops import temporary_file
+from app.utils.model_utils import generate_text_embeddings_batch, generate_text_embeddings_cached, load_clip_model
+from app.utils.vector_ops import normalize_rows_
 from transformers import CLIPModel, CLIPProcessor
 
 logger = logging.getLogger(__name__)
@@ -21,11 +27,26 @@ class FAISSService:
             self.index_path = index_dir
             self.index_path.mkdir(parents=True, exist_ok=True)
             self.embedding_dim = settings.EMBEDDING_DIM
+            self.device = clip_device
+            self._gpu_resources = None
+            self._on_gpu = False
+            self._index_read_only = False
+            # Set from the CPU index: GPU IVF indexes are not recognized by try_extract_index_ivf
+            self._is_ivf = False
+            # Embeddings precomputed at startup (see precompute_query_embeddings); read-only afterwards
+            self._query_cache: Dict[str, np.ndarray] = {}
+            # Guards index/metadata mutation; saves hold it only while taking a snapshot
+            self._lock = threading.RLock()
+            # Keeps saves in order, so an older snapshot never replaces a newer one on disk
+            self._save_lock = threading.Lock()
+            self._save_executor = None
+            # Reusable staging buffer for incoming embedding batches (grown geometrically)
+            self._emb_buf = np.empty((0, self.embedding_dim), dtype=np.float32)
             
             # Load CLIP model for text embeddings
             self.clip_model, self.clip_processor = load_clip_model(clip_model_name, clip_device)
             
-            self.index = self._initialize_index()
+            self.index = self._to_device(self._initialize_index())
             self.metadata = self._load_metadata()
             logger.info(f"FAISSService initialized with {self.index.ntotal} vectors in index.")
         except Exception as e:
@@ -37,99 +58,334 @@ class FAISSService:
         """Initialize or load the FAISS index."""
         index_file = self.index_path / "index.faiss"
         if index_file.exists():
-            logger.info(f"Loading existing FAISS index from {index_file}")
-            return faiss.read_index(str(index_file))
+            index = self._read_index(index_file)
         else:
-            logger.info(f"Creating new FAISS index (IndexFlatIP) with dim {self.embedding_dim}")
-            return faiss.IndexFlatIP(self.embedding_dim)
+            # Small corpora stay on exact search; see maybe_convert_to_ivf for the switch
+            index = self._new_flat_index()
+        self._is_ivf = faiss.try_extract_index_ivf(index) is not None
+        self._apply_search_params(index)
+        return index
+
+    def _read_index(self, index_file: Path) -> faiss.Index:
+        """Read the index from disk, memory-mapping it when enabled."""
+        if settings.FAISS_MMAP_INDEX:
+            try:
+                logger.info(f"Memory-mapping existing FAISS index from {index_file}")
+                index = faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self._index_read_only = True
+                return index
+            except RuntimeError as e:
+                # Older FAISS builds only support mmap for some index types
+                logger.warning(f"Could not memory-map FAISS index, reading it into memory: {e}")
+        logger.info(f"Loading existing FAISS index from {index_file}")
+        return faiss.read_index(str(index_file))
+
+    def _ensure_writable(self) -> None:
+        """Replace a memory-mapped, read-only index with an in-memory copy before modifying or rewriting it."""
+        if not self._index_read_only:
+            return
+        # Re-read rather than clone_index: IVF indexes are mapped with on-disk inverted lists,
+        # which cannot be cloned and would be written back as a stub pointing at the old file
+        index_file = self.index_path / "index.faiss"
+        logger.info(f"Reading memory-mapped FAISS index {index_file} into memory for writing")
+        index = faiss.read_index(str(index_file))
+        self._apply_search_params(index)
+        self.index = index
+        self._index_read_only = False
+
+    def _new_flat_index(self) -> faiss.Index:
+        """Create an empty exact-search index in the configured storage precision."""
+        if settings.FAISS_STORAGE_DTYPE == "fp16":
+            # Flat scans are memory-bound; fp16 codes halve the bytes read per query.
+            # Queries stay fp32 and FAISS decodes the codes on the fly.
+            logger.info(f"Creating new FAISS index (IndexScalarQuantizer fp16) with dim {self.embedding_dim}")
+            return faiss.IndexScalarQuantizer(self.embedding_dim, faiss.ScalarQuantizer.QT_fp16,
+                                              faiss.METRIC_INNER_PRODUCT)
+        logger.info(f"Creating new FAISS index (IndexFlatIP) with dim {self.embedding_dim}")
+        return faiss.IndexFlatIP(self.embedding_dim)
+
+    def _apply_search_params(self, index: faiss.Index) -> None:
+        """Set query-time parameters on IVF indexes (no-op for Flat)."""
+        if faiss.try_extract_index_ivf(index) is not None:
+            faiss.ParameterSpace().set_index_parameter(index, "nprobe", settings.FAISS_NPROBE)
+            logger.info(f"Using nprobe={settings.FAISS_NPROBE} for IVF index")
+
+    def _to_device(self, index: faiss.Index) -> faiss.Index:
+        """Copy the index to GPU 0 when running on CUDA with a GPU-enabled FAISS build."""
+        self._on_gpu = False
+        if self.device != "cuda":
+            return index
+        if not hasattr(faiss, "StandardGpuResources"):
+            logger.warning("CUDA requested but FAISS was built without GPU support; searching on CPU")
+            return index
+        try:
+            if self._gpu_resources is None:
+                self._gpu_resources = faiss.StandardGpuResources()
+            cloner_options = faiss.GpuClonerOptions()
+            cloner_options.useFloat16 = settings.FAISS_STORAGE_DTYPE == "fp16"
+            cpu_index = index
+            if isinstance(cpu_index, faiss.IndexScalarQuantizer):
+                # There is no GPU flat scalar quantizer; an fp16 GpuIndexFlat stores the same precision
+                cpu_index = faiss.IndexFlatIP(self.embedding_dim)
+                cpu_index.add(index.reconstruct_n(0, index.ntotal))
+            gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, cpu_index, cloner_options)
+        except Exception as e:
+            # Not every index type has a GPU implementation
+            logger.warning(f"Could not move FAISS index to GPU, searching on CPU: {e}")
+            return index
+        self._on_gpu = True
+        self._index_read_only = False # The GPU copy lives in device memory
+        logger.info("FAISS index moved to GPU 0")
+        return gpu_index
+
+    def _cpu_index(self) -> faiss.Index:
+        """Return a CPU copy of the index (the index itself when it already lives on CPU)."""
+        if self._on_gpu:
+            return faiss.index_gpu_to_cpu(self.index)
+        return self.index
+
+    def _storage_index(self) -> faiss.Index:
+        """Return the CPU index to write to disk, in the configured storage precision."""
+        index = self._cpu_index()
+        if settings.FAISS_STORAGE_DTYPE == "fp16" and isinstance(index, faiss.IndexFlat):
+            # GPU copies come back as fp32 Flat; re-encode so the file keeps fp16 codes
+            storage_index = self._new_flat_index()
+            storage_index.add(index.reconstruct_n(0, index.ntotal))
+            return storage_index
+        return index
+
+    @handle_faiss_errors("Failed to convert FAISS index to IVF")
+    def maybe_convert_to_ivf(self) -> bool:
+        """
+        Rebuild the Flat index as IVF-PQ once the corpus outgrows brute-force search.
+
+        Training takes a while on a large corpus, so it runs outside the lock;
+        vectors stored in the meantime are copied over before the swap.
+
+        Returns:
+            True if the index was converted
+        """
+        with self._lock:
+            if self._is_ivf or self.index.ntotal < settings.FAISS_IVF_MIN_VECTORS:
+                return False
+            ntotal = self.index.ntotal
+            vectors = self._cpu_index().reconstruct_n(0, ntotal)
+
+        logger.info(f"Converting FAISS index to '{settings.FAISS_IVF_FACTORY}' ({ntotal} vectors)")
+        # Vector ids stay sequential, so metadata positions remain valid after the rebuild
+        ivf_index = faiss.index_factory(self.embedding_dim, settings.FAISS_IVF_FACTORY, faiss.METRIC_INNER_PRODUCT)
+        ivf_index.train(vectors)
+        ivf_index.add(vectors)
+        del vectors
+
+        with self._lock:
+            if self.index.ntotal > ntotal:
+                ivf_index.add(self._cpu_index().reconstruct_n(ntotal, self.index.ntotal - ntotal))
+            self._apply_search_params(ivf_index)
+            self.index = self._to_device(ivf_index)
+            self._is_ivf = True
+            self._index_read_only = False
+        return True
 
     @handle_faiss_errors("Failed to load metadata")
-    def _load_metadata(self) -> List[Dict[str, Any]]:
-        """Load metadata from file or initialize empty list."""
+    def _load_metadata(self) -> FrameMetadataStore:
+        """Load metadata from file or initialize an empty store."""
         metadata_path = self.index_path / "metadata.json"
         if metadata_path.exists():
             logger.info(f"Loading existing metadata from {metadata_path}")
             try:
-                with open(metadata_path, 'r') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
+                with open(metadata_path, 'rb') as f:
+                    data = orjson.loads(f.read())
+                    if isinstance(data, dict):
+                        store = FrameMetadataStore.from_columns(data)
+                        logger.info(f"Loaded {len(store)} metadata entries.")
+                        return store
+                    elif isinstance(data, list):
+                         # Row-per-frame format written by older versions; rewritten as columns on the next save
                          logger.info(f"Loaded {len(data)} metadata entries.")
-                         return data
+                         return FrameMetadataStore.from_records(data)
                     else:
-                        logger.warning(f"Metadata file {metadata_path} did not contain a list. Initializing empty metadata.")
-                        return []
-            except json.JSONDecodeError:
-                logger.error(f"Error decoding JSON from metadata file {metadata_path}. Initializing empty metadata.", exc_info=True)
-                return []
+                        logger.warning(f"Metadata file {metadata_path} did not contain columns or a list. Initializing empty metadata.")
+                        return FrameMetadataStore()
+            except (orjson.JSONDecodeError, KeyError, ValueError):
+                logger.error(f"Error reading metadata file {metadata_path}. Initializing empty metadata.", exc_info=True)
+                return FrameMetadataStore()
         logger.info("Metadata file not found. Initializing new metadata")
-        return []
+        return FrameMetadataStore()
+
+    def save_index(self) -> Future:
+        """
+        Save the FAISS index and metadata to disk on a background thread.
+
+        Saves run one at a time on a single worker thread. Callers that must
+        wait for the files (e.g. before exiting) use save_index_blocking or
+        call result() on the returned future.
+        """
+        if self._save_executor is None:
+            self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-save")
+        return self._save_executor.submit(self.save_index_blocking)
 
     @handle_faiss_errors("Failed to save FAISS index and metadata")
-    def save_index(self) -> None:
-        """Save the current FAISS index and metadata to disk."""
+    def save_index_blocking(self) -> None:
+        """
+        Save the current FAISS index and metadata to disk, replacing both files atomically.
+
+        The lock is held only to snapshot the index and metadata in memory; the
+        files are written after it is released, so stores are not blocked by disk I/O.
+        """
         index_file = self.index_path / "index.faiss"
         metadata_path = self.index_path / "metadata.json"
 
-        logger.info(f"Saving FAISS index to {index_file} ({self.index.ntotal} vectors)")
-        faiss.write_index(self.index, str(index_file))
+        with self._save_lock:
+            with self._lock:
+                self._ensure_writable()
+                index_bytes = faiss.serialize_index(self._storage_index())
+                # Copies, as the live columns keep growing while the file is written
+                columns = {name: column.copy() for name, column in self.metadata.to_columns().items()}
+                ntotal = self.index.ntotal
+
+            # Unique temp names in the target directory; anything left over after a failure is removed
+            with temporary_file(suffix=".faiss.tmp", directory=self.index_path) as tmp_index_file, \
+                    temporary_file(suffix=".json.tmp", directory=self.index_path) as tmp_metadata_path:
+                # Write both files next to their targets first so a crash never leaves a half-written pair.
+                # os.replace swaps in a new inode, so an index memory-mapped from the old file stays valid.
+                logger.info(f"Saving FAISS index to {index_file} ({ntotal} vectors)")
+                with open(tmp_index_file, 'wb') as f:
+                    f.write(memoryview(index_bytes))
+                del index_bytes
 
-        logger.info(f"Saving metadata to {metadata_path} ({len(self.metadata)} entries)")
-        with open(metadata_path, 'w') as f:
-            json.dump(self.metadata, f, indent=2) # Add indent for readability
+                logger.info(f"Saving metadata to {metadata_path} ({len(columns['frame_path'])} entries)")
+                with open(tmp_metadata_path, 'wb') as f:
+                    # Columns, not one dict per frame: no per-row keys on disk and no dicts built on save or load
+                    f.write(orjson.dumps(columns, option=orjson.OPT_SERIALIZE_NUMPY))
 
+                os.replace(tmp_index_file, index_file)
+                os.replace(tmp_metadata_path, metadata_path)
         logger.info("Index and metadata saved successfully")
 
+    def _staging_rows(self, n: int) -> np.ndarray:
+        """Return an (n, dim) view of the staging buffer, growing it geometrically if needed."""
+        if self._emb_buf.shape[0] < n:
+            capacity = max(n, 2 * self._emb_buf.shape[0])
+            self._emb_buf = np.empty((capacity, self.embedding_dim), dtype=np.float32)
+        return self._emb_buf[:n]
+
+    def store_embeddings(self, embeddings: Union[List[np.ndarray], np.ndarray], metadata: List[Dict[str, Any]]) -> None:
+        """
+        Store embeddings and metadata dicts in the FAISS index (in memory).
+
+        See store_embeddings_soa, which this delegates to.
+        """
+        self.store_embeddings_soa(embeddings, *FrameMetadataStore.columns_from_records(metadata))
+
     @handle_faiss_errors("Failed to store embeddings")
-    def store_embeddings(self, embeddings: List[np.ndarray], metadata: List[Dict[str, Any]]) -> None:
-        """Store embeddings and metadata in the FAISS index (in memory)."""
-        if not embeddings:
+    def store_embeddings_soa(self,
+                             embeddings: Union[List[np.ndarray], np.ndarray],
+                             frame_paths: List[str],
+                             video_names: List[str],
+                             timestamps: List[float]) -> None:
+        """
+        Store embeddings with their metadata given as parallel columns (in memory).
+
+        A C-contiguous float32 (n, dim) array is used as-is and normalized in place;
+        anything else is copied into the staging buffer first. The columns are
+        appended to the metadata store without building a dict per frame.
+        """
+        if len(embeddings) == 0:
             logger.warning("store_embeddings called with empty embeddings list.")
             return
+        if not (len(frame_paths) == len(video_names) == len(timestamps) == len(embeddings)):
+            raise ValueError("Embeddings and metadata columns must have the same length")
 
-        # Ensure embeddings are normalized (should be already from model_utils)
-        embeddings_array = np.array(embeddings).astype('float32')
+        # The lock keeps the staging buffer, index and metadata consistent with background saves
+        with self._lock:
+            if (isinstance(embeddings, np.ndarray) and embeddings.dtype == np.float32
+                    and embeddings.flags['C_CONTIGUOUS'] and embeddings.shape[1:] == (self.embedding_dim,)):
+                embeddings_array = embeddings
+            else:
+                # Copy the batch straight into the contiguous float32 staging buffer
+                embeddings_array = self._staging_rows(len(embeddings))
+                try:
+                    if isinstance(embeddings, np.ndarray):
+                        embeddings_array[...] = embeddings
+                    else:
+                        np.stack(embeddings, out=embeddings_array)
+                except ValueError as e:
+                     shapes = {np.shape(emb) for emb in embeddings}
+                     logger.error(f"Invalid embeddings shapes: {shapes}. Expected (*, {self.embedding_dim})")
+                     raise ValueError(f"Invalid embeddings shape: {shapes}") from e
 
-        # Basic shape validation
-        if len(embeddings_array.shape) != 2 or embeddings_array.shape[1] != self.embedding_dim:
-             logger.error(f"Invalid embeddings shape: {embeddings_array.shape}. Expected (*, {self.embedding_dim})")
-             raise ValueError(f"Invalid embeddings shape: {embeddings_array.shape}")
+            # Inner product is only cosine similarity for unit vectors; renormalize in place
+            normalize_rows_(embeddings_array)
 
-        self.index.add(embeddings_array)
-        self.metadata.extend(metadata)
+            self._ensure_writable()
+            self.index.add(embeddings_array)
+            self.metadata.extend_columns(frame_paths, video_names, timestamps)
 
         logger.debug(f"Added {len(embeddings)} embeddings to index (current total: {self.index.ntotal})")
 
-    @handle_faiss_errors("Failed to search embeddings")
     def search(self, query: str, top_k: int = 4) -> Dict[str, List[Dict[str, Any]]]:
         """Search for similar frames using FAISS index."""
+        return self.search_batch([query], top_k)[0]
+
+    def precompute_query_embeddings(self, queries: List[str]) -> None:
+        """Embed known queries once so searches for them skip CLIP entirely."""
+        if not queries:
+            return
+        queries = list(dict.fromkeys(queries))
+        embeddings = generate_text_embeddings_batch(queries, self.clip_model, self.clip_processor)
+        for query, embedding in zip(queries, embeddings):
+            embedding = embedding.astype(np.float32)
+            embedding.setflags(write=False) # Shared across request threads
+            self._query_cache[query] = embedding
+        logger.info(f"Precomputed embeddings for {len(queries)} popular queries")
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Return a (len(queries), dim) float32 matrix, running CLIP only for queries not already cached."""
+        query_array = np.empty((len(queries), self.embedding_dim), dtype=np.float32)
+        misses = []
+        for i, query in enumerate(queries):
+            cached = self._query_cache.get(query)
+            if cached is None:
+                misses.append(i)
+            else:
+                query_array[i] = cached
+
+        if misses:
+            # Everything else goes through the shared LRU of text embeddings
+            query_array[misses] = generate_text_embeddings_cached(
+                [queries[i] for i in misses], self.clip_model, self.clip_processor
+            )
+        return query_array
+
+    @handle_faiss_errors("Failed to search embeddings")
+    def search_batch(self, queries: List[str], top_k: int = 4) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """Search for several queries with one CLIP forward pass and one FAISS search."""
         if self.index.ntotal == 0:
             logger.warning("Search called on an empty FAISS index.")
-            return {"results": []}
+            return [{"results": []} for _ in queries]
 
-        # Revert to single query embedding generation
         try:
-            query_embedding = generate_text_embedding(query, self.clip_model, self.clip_processor)
+            query_array = self._embed_queries(queries)
         except Exception as e:
-            logger.error(f"Failed to generate embedding for query '{query}': {e}", exc_info=True)
-            return {"results": []} # Return empty on embedding failure
-        
-        query_array = np.array([query_embedding], dtype=np.float32)
-        # Ensure the embedding is normalized (generate_text_embedding should already do this)
-        # query_array = query_array / np.linalg.norm(query_array)
+            logger.error(f"Failed to generate embeddings for queries {queries}: {e}", exc_info=True)
+            return [{"results": []} for _ in queries] # Return empty on embedding failure
 
         # Search in FAISS index (IP = Inner Product/Cosine Similarity for normalized vectors)
         distances, indices = self.index.search(query_array, top_k)
 
-        # Get metadata for matched frames
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if 0 <= idx < len(self.metadata): # Check bounds
-                frame_info = self.metadata[idx].copy() # Get a copy
-                # Add similarity score to the result
-                frame_info['similarity'] = float(distance)
-                results.append(frame_info)
-            else:
-                logger.warning(f"Search returned invalid index {idx}, metadata length {len(self.metadata)}")
+        # Bounds-check every returned id at once; FAISS pads with -1 when it finds fewer than top_k
+        metadata_len = len(self.metadata)
+        valid_mask = (indices >= 0) & (indices < metadata_len)
+        out_of_range = int(np.count_nonzero(indices >= metadata_len))
+        if out_of_range:
+            logger.warning(f"Search returned {out_of_range} indices beyond metadata length {metadata_len}")
+
+        batch_results = []
+        for query, row_indices, row_distances, row_valid in zip(queries, indices, distances, valid_mask):
+            # Get metadata for matched frames in one vectorized gather
+            results = self.metadata.take(row_indices[row_valid], similarity=row_distances[row_valid])
 
-        logger.info(f"Search for query '{query}' completed with {len(results)} results")
-        return {"results": results} 
\ No newline at end of file
+            logger.debug("Search for query %r completed with %d results", query, len(results))
+            batch_results.append({"results": results})
+        return batch_results
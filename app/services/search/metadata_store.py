@@ -0,0 +1,127 @@
+import numpy as np
+from typing import List, Dict, Any, Iterable, Sequence, Tuple
+
+class FrameMetadataStore:
+    """
+    Column-oriented (SoA) metadata for the vectors in the FAISS index.
+
+    Row i describes vector i of the index. Strings are kept in plain lists and
+    timestamps in a contiguous float64 buffer grown geometrically, so appending a
+    batch never builds per-frame dicts.
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self._frame_paths: List[str] = []
+        self._video_names: List[str] = []
+        self._timestamps = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+        # Object-array views of the string columns for vectorized lookups (see take)
+        self._path_array = np.empty(0, dtype=object)
+        self._name_array = np.empty(0, dtype=object)
+
+    COLUMN_NAMES = ("frame_path", "video_name", "timestamp")
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "FrameMetadataStore":
+        """Build a store from a list of metadata dicts (the legacy on-disk format)."""
+        store = cls()
+        store.extend(records)
+        return store
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Sequence[Any]]) -> "FrameMetadataStore":
+        """Build a store from a dict of parallel column lists (the on-disk format, see to_columns)."""
+        store = cls()
+        store.extend_columns(*(columns[name] for name in cls.COLUMN_NAMES))
+        return store
+
+    def __len__(self) -> int:
+        return len(self._frame_paths)
+
+    def _reserve(self, extra: int) -> None:
+        needed = len(self) + extra
+        if needed > self._timestamps.shape[0]:
+            capacity = max(needed, 2 * self._timestamps.shape[0])
+            grown = np.empty(capacity, dtype=np.float64)
+            grown[:len(self)] = self._timestamps[:len(self)]
+            self._timestamps = grown
+
+    def extend_columns(self,
+                       frame_paths: Sequence[str],
+                       video_names: Sequence[str],
+                       timestamps: Sequence[float]) -> None:
+        """Append one batch given as parallel columns."""
+        if not (len(frame_paths) == len(video_names) == len(timestamps)):
+            raise ValueError("Metadata columns must have the same length")
+        start = len(self)
+        self._reserve(len(frame_paths))
+        self._timestamps[start:start + len(timestamps)] = timestamps
+        self._frame_paths.extend(frame_paths)
+        self._video_names.extend(video_names)
+
+    @staticmethod
+    def columns_from_records(records: Iterable[Dict[str, Any]]) -> Tuple[List[str], List[str], List[float]]:
+        """Split metadata dicts into (frame_paths, video_names, timestamps) columns."""
+        records = list(records)
+        return (
+            [str(r.get("frame_path", "")) for r in records],
+            [str(r.get("video_name", "")) for r in records],
+            [float(r.get("timestamp", 0.0)) for r in records],
+        )
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Append metadata dicts with 'frame_path', 'video_name' and 'timestamp' keys."""
+        self.extend_columns(*self.columns_from_records(records))
+
+    def record(self, idx: int) -> Dict[str, Any]:
+        """Return row idx as a new dict."""
+        return {
+            "frame_path": self._frame_paths[idx],
+            "video_name": self._video_names[idx],
+            "timestamp": float(self._timestamps[idx]),
+        }
+
+    def _string_arrays(self):
+        """Return object-array views of the string columns, rebuilt only after appends."""
+        if self._path_array.shape[0] != len(self):
+            self._path_array = np.array(self._frame_paths, dtype=object)
+            self._name_array = np.array(self._video_names, dtype=object)
+        return self._path_array, self._name_array
+
+    def take(self, indices: np.ndarray, **extra_columns: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Gather several rows at once as new dicts.
+
+        Args:
+            indices: Valid row indices
+            extra_columns: Per-index values to add to each dict (e.g. similarity=scores)
+
+        Returns:
+            One metadata dict per index
+        """
+        path_array, name_array = self._string_arrays()
+        keys = ["frame_path", "video_name", "timestamp", *extra_columns]
+        # tolist() yields plain Python objects, which are cheaper to iterate than ndarray scalars
+        columns = [
+            path_array[indices].tolist(),
+            name_array[indices].tolist(),
+            self._timestamps[indices].tolist(),
+            *(np.asarray(values).tolist() for values in extra_columns.values()),
+        ]
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+
+    def to_columns(self) -> Dict[str, Any]:
+        """Return all rows as parallel columns (the on-disk format); timestamps stay a float64 array."""
+        return {
+            "frame_path": self._frame_paths,
+            "video_name": self._video_names,
+            "timestamp": self._timestamps[:len(self)],
+        }
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Return all rows as metadata dicts."""
+        return [
+            {"frame_path": path, "video_name": name, "timestamp": ts}
+            for path, name, ts in zip(self._frame_paths, self._video_names,
+                                      self._timestamps[:len(self)].tolist())
+        ]
@@ -0,0 +1,68 @@
+"""CPU-side video work run in decode worker processes.
+
+Workers only decode and hash frames (OpenCV/PyAV + NumPy) and never load CLIP
+or touch the GPU; the main process consumes their batches from a shared queue.
+This module imports nothing heavier than that. Under the spawn start method each
+worker also re-imports the launching __main__ module, so entry points that start
+workers (app/process_videos.py) keep torch/transformers/FAISS imports inside
+functions.
+"""
+
+import logging
+from itertools import islice
+from typing import Optional
+
+import numpy as np
+
+from app.utils.image_ops import PerceptualHasher, extract_frames
+
+logger = logging.getLogger(__name__)
+
+# Result queue of this worker process, set by init_worker. A multiprocessing.Queue can
+# only reach a child at process start, so it is passed through the pool initializer.
+_queue = None
+
+
+def init_worker(queue) -> None:
+    """ProcessPoolExecutor initializer: remember the queue batches are put on."""
+    global _queue
+    _queue = queue
+
+
+def decode_video_batches(
+    video_path: str,
+    fps: float,
+    batch_size: int,
+    decoder: str,
+    hwaccel: Optional[str]
+) -> None:
+    """
+    Decode a video and put (video_path, frames, timestamps, hashes, error) batches on the worker's queue.
+
+    The last message for a video always has frames set to None; its error field
+    holds the failure message if decoding failed, otherwise None.
+
+    Args:
+        video_path: Path to the video file
+        fps: Target frames per second to extract
+        batch_size: Frames per queued batch
+        decoder: Frame decoder passed to extract_frames
+        hwaccel: Hardware device type passed to extract_frames
+    """
+    hasher = PerceptualHasher()
+    error = None
+    try:
+        frames_iter = extract_frames(video_path, fps=fps, decoder=decoder, hwaccel=hwaccel)
+        while True:
+            batch = list(islice(frames_iter, batch_size))
+            if not batch:
+                break
+            frames = [frame for frame, _ in batch]
+            timestamps = [timestamp for _, timestamp in batch]
+            hashes = np.array([hasher(frame) for frame in frames], dtype=np.uint64)
+            _queue.put((video_path, frames, timestamps, hashes, None))
+    except Exception as e:
+        logger.error(f"Error decoding video {video_path}: {e}", exc_info=True)
+        error = str(e)
+    finally:
+        _queue.put((video_path, None, None, None, error))
@@ -1,65 +1,77 @@
+from app.core.config import settings
 from app.services.search.faiss_service import FAISSService
-from typing import List, Dict, Any
+from app.services.search.batcher import SearchBatcher
+from typing import List, Dict, Any, Optional
+import asyncio
+import functools
 import logging
 import urllib.parse
-from pathlib import Path # Import Path for better path handling
 
 logger = logging.getLogger(__name__)
 
+
+@functools.lru_cache(maxsize=10_000)
+def _encode_frame_path(relative_frame_path: str) -> str:
+    """URL-encode a frame path relative to FRAMES_DIR; cached as the same frames recur across queries."""
+    return urllib.parse.quote(relative_frame_path.replace('\\', '/').lstrip('/'), safe='/')
+
+
 class FrameProcessor:
     # Accept dependencies via __init__
-    def __init__(self, faiss_service: FAISSService, base_url: str):
+    def __init__(self, faiss_service: FAISSService, base_url: str,
+                 search_batcher: Optional[SearchBatcher] = None):
         self.faiss_service = faiss_service # Use passed service
         self.base_url = base_url # Use passed base_url
+        # With X-Accel the app no longer mounts /static; URLs go through the frames route,
+        # which answers with an X-Accel-Redirect for Nginx to serve the file
+        frames_route = "api/v1/frames" if settings.USE_XACCEL else "static/frames"
+        self._url_prefix = f"{base_url.rstrip('/')}/{frames_route}/"
+        self.search_batcher = search_batcher # Optional micro-batching front for faiss_service
 
     def search_frames(self, query: str, top_k: int) -> Dict[str, List[Dict[str, Any]]]:
         """Search for frames matching the query text."""
         try:
             # Get search results from FAISS service using single query
             search_response = self.faiss_service.search(query, top_k)
-            
-            # Process the results
-            processed_results = []
-            for result in search_response["results"]:
-                # Extract frame_path relative to FRAMES_DIR (assuming it's stored this way)
-                # Need to adjust if the actual metadata key is different or path is absolute
-                frame_path_metadata_key = 'frame_path' # Assuming this is the key in metadata
-                relative_frame_path_str = result.get(frame_path_metadata_key)
-
-                if not relative_frame_path_str:
-                    logger.warning(f"Skipping result with missing '{frame_path_metadata_key}': {result}")
-                    continue
-                
-                # Ensure it's treated as a relative path
-                relative_frame_path = Path(relative_frame_path_str)
+            return self._build_response(search_response)
+        except Exception as e:
+            # Log with traceback for single query
+            logger.error(f"FrameProcessor search failed for query '{query}': {str(e)}", exc_info=True)
+            raise
 
-                # Construct path relative to the base URL's static path
-                # Assume the base static path for frames is /static/frames/
-                static_path = Path("static") / "frames" / relative_frame_path
+    async def search_frames_async(self, query: str, top_k: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Search for frames, sharing the CLIP/FAISS work with concurrent requests when batching is enabled."""
+        if self.search_batcher is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.search_frames, query, top_k)
+        try:
+            search_response = await self.search_batcher.submit(query, top_k)
+            return self._build_response(search_response)
+        except Exception as e:
+            logger.error(f"FrameProcessor search failed for query '{query}': {str(e)}", exc_info=True)
+            raise
 
-                # Convert to URL path format (forward slashes)
-                url_path_segment = static_path.as_posix()
+    def _build_response(self, search_response: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Convert raw FAISS results into API results with image URLs."""
+        # Process the results
+        processed_results = []
+        for result in search_response["results"]:
+            # Extract frame_path relative to FRAMES_DIR (assuming it's stored this way)
+            # Need to adjust if the actual metadata key is different or path is absolute
+            frame_path_metadata_key = 'frame_path' # Assuming this is the key in metadata
+            relative_frame_path_str = result.get(frame_path_metadata_key)
 
-                # URL encode the path segment *carefully*
-                # We only want to encode the filename part usually, not the slashes
-                # However, full encoding is safer if filenames might have special chars
-                # Let's encode the whole segment for safety, matching previous behavior
-                encoded_path_segment = urllib.parse.quote(url_path_segment)
+            if not relative_frame_path_str:
+                logger.warning(f"Skipping result with missing '{frame_path_metadata_key}': {result}")
+                continue
 
-                # Create a full URL
-                # Ensure no double slashes between base_url and segment
-                full_url = f"{self.base_url.rstrip('/')}/{encoded_path_segment.lstrip('/')}"
+            # Only the relative part can contain characters that need encoding; the prefix is fixed
+            full_url = self._url_prefix + _encode_frame_path(relative_frame_path_str)
 
-                # Create result dictionary with image_url only
-                processed_result = {
-                    'image_url': full_url
-                }
-                
-                processed_results.append(processed_result)
-            
-            return {"results": processed_results}
+            # Create result dictionary with image_url only
+            processed_result = {
+                'image_url': full_url
+            }
             
-        except Exception as e:
-            # Log with traceback for single query
-            logger.error(f"FrameProcessor search failed for query '{query}': {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            processed_results.append(processed_result)
+        
+        return {"results": processed_results}
@@ -3,8 +3,13 @@ import numpy as np
 from pathlib import Path
 import torch
 import logging
-from typing import List, Dict, Any, Generator, Tuple, Optional
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from queue import Empty
+from typing import List, Dict, Generator, Tuple, Optional
 import time
+from itertools import islice
 from tqdm import tqdm
 from transformers import CLIPModel, CLIPProcessor
 
@@ -12,17 +17,61 @@ from transformers import CLIPModel, CLIPProcessor
 from app.core.config import settings
 
 from app.services.search.faiss_service import FAISSService
+from app.services.video import decode_worker
 from app.utils.error_handling import VideoProcessingError, handle_video_processing_errors
 from app.utils.file_ops import ensure_directory
-from app.utils.image_ops import save_frame, extract_frames
+from app.utils.image_ops import save_frame, extract_frames, estimate_extracted_frame_count
 from app.utils.model_utils import (
     load_clip_model,
-    generate_image_embedding
+    generate_image_embeddings_batch
 )
 from app.utils.duplicate_detector import DuplicateDetector
+from app.utils.trt_utils import load_trt_image_encoder
 
 logger = logging.getLogger(__name__)
 
+# Decoded batches waiting for the GPU across all workers. Kept small and independent of the
+# worker count: each batch is BATCH_SIZE raw frames (about 200 MB at 1080p and 32 frames).
+DECODE_QUEUE_BATCHES = 2
+
+
+def _iter_batches(items, size: int):
+    """Yield lists of up to `size` consecutive items from an iterable."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _log_checkpoint_failure(future: Future) -> None:
+    """Log a failed background checkpoint; the run continues and the final save retries."""
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Checkpoint save failed: {error}")
+
+
+class _VideoRun:
+    """Counters and the pending FAISS batch of one video while it is being processed."""
+
+    def __init__(self, video_name: str, duplicate_detector: DuplicateDetector):
+        self.video_name = video_name
+        self.duplicate_detector = duplicate_detector
+        self.start_time = time.time()
+        self.frames_extracted = 0
+        self.frames_stored = 0
+        self.duplicates_detected = 0
+        # Pending FAISS batch, with the metadata kept as parallel columns
+        self.embeddings_batch: List[np.ndarray] = []
+        self.frame_paths: List[str] = []
+        self.video_names: List[str] = []
+        self.timestamps: List[float] = []
+        # JPEG writes of the frames in the pending batch; the batch is stored only once they succeed
+        self.frame_saves: List[Future] = []
+        self.failed = False
+
+
 class VideoProcessor:
     """Process videos to extract frames, detect duplicates, and store embeddings."""
     
@@ -37,6 +86,12 @@ class VideoProcessor:
         self.clip_model = clip_model
         self.clip_processor = clip_processor
         self.faiss_service = faiss_service
+        # Batched image embeddings go through TensorRT when enabled and available
+        self.image_encoder = clip_model
+        if settings.USE_TRT:
+            trt_encoder = load_trt_image_encoder(settings.TRT_ENGINE_PATH, settings.CLIP_DEVICE)
+            if trt_encoder is not None:
+                self.image_encoder = trt_encoder
         self.clip_model_name = settings.CLIP_MODEL_NAME
         self.device = settings.CLIP_DEVICE
         self.frames_dir = settings.FRAMES_DIR
@@ -63,15 +118,14 @@ class VideoProcessor:
         
         try:
             # Initialize Duplicate Detector using settings
-            self.duplicate_detector = DuplicateDetector(
-                clip_model=self.clip_model,
-                clip_processor=self.clip_processor,
-                hash_threshold=self.hash_threshold,
-                window_size=self.window_size
-            )
+            self.duplicate_detector = self._new_duplicate_detector()
             
             # Create directories
             ensure_directory(self.frames_dir)
+
+            # JPEG encoding and disk writes overlap with decoding and embedding
+            self._save_executor = ThreadPoolExecutor(max_workers=settings.FRAME_SAVE_THREADS, thread_name_prefix="frame-save")
+            self._pending_saves: List[Future] = []
             
             # Initialize statistics
             self.processed_videos = set()
@@ -86,58 +140,150 @@ class VideoProcessor:
                 logger.error("CUDA device mismatch detected. Try running with --use-cpu flag.")
             raise
     
-    def process_frame(self, frame: np.ndarray, timestamp: float, video_name: str, frame_index: int) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+    def _new_duplicate_detector(self) -> DuplicateDetector:
+        """Create a duplicate detector configured from settings."""
+        return DuplicateDetector(
+            clip_model=self.clip_model,
+            clip_processor=self.clip_processor,
+            hash_threshold=self.hash_threshold,
+            window_size=self.window_size
+        )
+
+    def _process_frame_batch(self,
+                             frames: List[np.ndarray],
+                             timestamps: List[float],
+                             video_name: str,
+                             frame_indices: List[int],
+                             duplicate_detector: Optional[DuplicateDetector] = None,
+                             frame_hashes: Optional[np.ndarray] = None) -> List[Tuple[Optional[str], Optional[np.ndarray], Optional[Future]]]:
         """
-        Process a single frame: generate embedding, check for duplicates, save if unique.
+        Process a batch of frames: one batched CLIP forward pass and duplicate search, then save per frame.
         
         Args:
-            frame: The frame image
-            timestamp: The timestamp of the frame
+            frames: The frame images
+            timestamps: The timestamps of the frames
             video_name: Name of the video
-            frame_index: Index of the frame
+            frame_indices: Indices of the frames
+            duplicate_detector: Detector holding this video's state (defaults to self.duplicate_detector)
+            frame_hashes: Optional perceptual hashes already computed by a decode worker
             
         Returns:
-            Tuple (metadata: Optional[Dict], embedding: Optional[np.ndarray]).
-            Both are None if duplicate, otherwise contain metadata and the embedding.
+            One (relative frame path, embedding, save future) tuple per frame; all None for duplicates.
         """
         try:
-            # Generate embedding
-            embedding = generate_image_embedding(
-                frame,
-                self.clip_model,
+            embeddings = generate_image_embeddings_batch(
+                frames,
+                self.image_encoder,
                 self.clip_processor
             )
+            # One duplicate-index search for the whole batch
+            detector = duplicate_detector if duplicate_detector is not None else self.duplicate_detector
+            decisions = detector.is_duplicate_batch(frames, embeddings, frame_hashes)
+        except Exception as e:
+            logger.error(f"Error processing frames {frame_indices[0]}-{frame_indices[-1]} from {video_name}: {str(e)}", exc_info=True)
+            return [(None, None, None)] * len(frames)
 
-            # Check if duplicate using the detector, which now returns embedding if not duplicate
-            is_dup, embedding_if_not_dup = self.duplicate_detector.is_duplicate(frame, embedding)
+        results = []
+        for frame, (is_dup, embedding), timestamp, frame_index in zip(frames, decisions, timestamps, frame_indices):
             if is_dup:
-                return None, None # Return None for both if duplicate
+                results.append((None, None, None))
+                continue
+            try:
+                frame_path, save_future = self._save_unique_frame(frame, video_name, frame_index)
+                results.append((frame_path, embedding, save_future))
+            except Exception as e:
+                logger.error(f"Error processing frame {frame_index} from {video_name}: {str(e)}", exc_info=True)
+                results.append((None, None, None))
+        return results
 
-            # Save frame to disk using the utility function
-            frame_path = self.frames_dir / f"{video_name}_frame_{frame_index:05d}.jpg"
-            save_frame(frame, frame_path)
-            
-            # Create metadata - store path relative to static dir eventually
-            # For now, storing relative to frames_dir
-            relative_frame_path = frame_path.relative_to(self.frames_dir)
-            metadata = {
-                # Store path relative to frames dir for now
-                "frame_path": str(relative_frame_path),
-                "video_name": video_name,
-                "timestamp": float(timestamp),
-            }
-            
-            # Return metadata and the non-duplicate embedding
-            return metadata, embedding_if_not_dup
-        except Exception as e:
-            logger.error(f"Error processing frame {frame_index} from {video_name}: {str(e)}", exc_info=True)
-            return None, None
+    def _save_unique_frame(self, frame: np.ndarray, video_name: str, frame_index: int) -> Tuple[str, Future]:
+        """Queue a non-duplicate frame for saving; return its path relative to frames_dir and the write's future."""
+        # Frames are written directly into frames_dir, so the relative path is just the file name
+        frame_name = f"{video_name}_frame_{frame_index:05d}.jpg"
+        future = self._save_executor.submit(save_frame, frame, self.frames_dir / frame_name, settings.FRAME_JPEG_QUALITY)
+        self._pending_saves.append(future)
+        return frame_name, future
     
+    def _consume_frames(self,
+                        run: _VideoRun,
+                        frames: List[np.ndarray],
+                        timestamps: List[float],
+                        frame_hashes: Optional[np.ndarray] = None) -> None:
+        """Embed, deduplicate and store one batch of a video's frames, updating its counters."""
+        frame_indices = list(range(run.frames_extracted, run.frames_extracted + len(frames)))
+        run.frames_extracted += len(frames)
+
+        results = self._process_frame_batch(frames, timestamps, run.video_name, frame_indices, run.duplicate_detector, frame_hashes)
+        for (frame_path, embedding, save_future), timestamp in zip(results, timestamps):
+            if frame_path is not None and embedding is not None:
+                run.frames_stored += 1
+                run.frame_saves.append(save_future)
+                run.embeddings_batch.append(embedding)
+                run.frame_paths.append(frame_path)
+                run.video_names.append(run.video_name)
+                run.timestamps.append(timestamp)
+
+                if len(run.embeddings_batch) >= self.batch_size:
+                    self._store_pending(run)
+            else:
+                run.duplicates_detected += 1
+
+        # Bound the frames held in memory by queued writes
+        self._wait_for_frame_saves(max_pending=4 * self.batch_size)
+
+    def _store_pending(self, run: _VideoRun) -> None:
+        """Hand a video's pending embeddings and metadata columns to FAISS in one call, once their frames are on disk."""
+        # A failed write raises here, before its row reaches the index; the video is then marked failed
+        wait(run.frame_saves)
+        for future in run.frame_saves:
+            future.result()
+        self.faiss_service.store_embeddings_soa(run.embeddings_batch, run.frame_paths, run.video_names, run.timestamps)
+        # Counted as soon as the rows are in the index, even if the video fails later,
+        # so finalize_processing knows the in-memory index differs from disk
+        self.total_frames_stored += len(run.embeddings_batch)
+        run.embeddings_batch = []
+        run.frame_paths = []
+        run.video_names = []
+        run.timestamps = []
+        run.frame_saves = []
+
+    def _wait_for_frame_saves(self, max_pending: int = 0) -> None:
+        """Block until at most `max_pending` frame writes are outstanding."""
+        # Write errors are raised by _store_pending, for the video the frame belongs to
+        if len(self._pending_saves) <= max_pending:
+            return
+        done, _ = wait(self._pending_saves[:len(self._pending_saves) - max_pending])
+        self._pending_saves = [future for future in self._pending_saves if future not in done]
+
+    def _finish_video(self, run: _VideoRun) -> None:
+        """Store a video's remaining embeddings and fold its counters into the totals."""
+        if run.embeddings_batch:
+            self._store_pending(run)
+
+        processing_time = time.time() - run.start_time
+        
+        # Update overall statistics
+        self.processed_videos.add(run.video_name)
+        self.total_frames_extracted += run.frames_extracted
+        self.total_duplicate_frames += run.duplicates_detected
+        
+        logger.info(f"Finished processing {run.video_name} in {processing_time:.2f} seconds")
+        logger.info(f"  Frames extracted: {run.frames_extracted}")
+        logger.info(f"  Duplicates detected: {run.duplicates_detected}")
+        logger.info(f"  Frames stored: {run.frames_stored}")
+
+        # Periodic checkpoint so a crash late in a long run does not lose everything.
+        # Stores wait only for the in-memory snapshot; the files are written on
+        # FAISSService's background thread while the next video is processed.
+        checkpoint_every = settings.CHECKPOINT_EVERY_N_VIDEOS
+        if checkpoint_every > 0 and len(self.processed_videos) % checkpoint_every == 0:
+            logger.info(f"Checkpointing FAISS index after {len(self.processed_videos)} videos")
+            self.faiss_service.save_index().add_done_callback(_log_checkpoint_failure)
+
     def process_video(self, video_path: str) -> None:
         """
         Process a single video: extract frames, generate embeddings, detect duplicates, store in FAISS.
         """
-        start_time = time.time()
         video_path_obj = Path(video_path)
         video_name = video_path_obj.name
         
@@ -148,63 +294,142 @@ class VideoProcessor:
             
         logger.info(f"Processing video: {video_name}")
         self.duplicate_detector.clear()
-        frames_extracted = 0
-        frames_stored = 0
-        duplicates_detected = 0
-        frame_metadata_batch = []
-        embeddings_batch = []
+        run = _VideoRun(video_name, self.duplicate_detector)
 
         try:
-            # Use FPS from settings
-            extracted_frames, timestamps = extract_frames(video_path_obj, fps=self.frame_extraction_fps)
-            logger.info(f"Extracted {len(extracted_frames)} potential frames.")
-
-            # TODO: Make tqdm optional based on config/log level
-            for i, (frame, timestamp) in enumerate(tqdm(zip(extracted_frames, timestamps), total=len(extracted_frames), desc=f"Processing {video_name}")):
-                frames_extracted += 1
-                metadata, embedding = self.process_frame(frame, timestamp, video_name, i)
-
-                if metadata is not None and embedding is not None:
-                    frames_stored += 1
-                    embeddings_batch.append(embedding)
-                    frame_metadata_batch.append(metadata)
-
-                    if len(embeddings_batch) >= self.batch_size:
-                        self.faiss_service.store_embeddings(embeddings_batch, frame_metadata_batch)
-                        embeddings_batch = []
-                        frame_metadata_batch = []
-                else:
-                    duplicates_detected += 1
-
-            if embeddings_batch:
-                self.faiss_service.store_embeddings(embeddings_batch, frame_metadata_batch)
-
-            end_time = time.time()
-            processing_time = end_time - start_time
-            
-            # Update overall statistics
-            self.processed_videos.add(video_name)
-            self.total_frames_extracted += frames_extracted
-            self.total_duplicate_frames += duplicates_detected
-            self.total_frames_stored += frames_stored
-            
-            logger.info(f"Finished processing {video_name} in {processing_time:.2f} seconds")
-            logger.info(f"  Frames extracted: {frames_extracted}")
-            logger.info(f"  Duplicates detected: {duplicates_detected}")
-            logger.info(f"  Frames stored: {frames_stored}")
+            # Use FPS from settings; frames are streamed so only one batch is held in memory
+            frames = extract_frames(
+                video_path_obj,
+                fps=self.frame_extraction_fps,
+                decoder=settings.VIDEO_DECODER,
+                hwaccel=settings.VIDEO_HWACCEL
+            )
+            # Progress bar only when INFO output is wanted; it writes to stderr on every update
+            if logger.isEnabledFor(logging.INFO):
+                expected_frames = estimate_extracted_frame_count(video_path_obj, self.frame_extraction_fps)
+                frames = tqdm(frames, total=expected_frames, desc=f"Processing {video_name}")
+            # Embed frames batch_size at a time; a batch of 1 leaves the GPU mostly idle
+            for batch in _iter_batches(frames, self.batch_size):
+                self._consume_frames(run, [frame for frame, _ in batch], [timestamp for _, timestamp in batch])
+
+            self._finish_video(run)
         except ValueError as e:
             logger.error(f"Skipping video {video_name} due to error: {e}", exc_info=True)
         except Exception as e:
             logger.error(f"Unexpected error processing video {video_name}: {e}", exc_info=True)
 
-    def process_all_videos(self, video_dir_override: Optional[Path] = None, allowed_extensions_override: Optional[List[str]] = None) -> None:
+    def _process_videos_parallel(self, video_files: List[Path], num_workers: int) -> None:
+        """
+        Decode videos in worker processes while this process embeds and stores their frames.
+        
+        Workers only decode and hash (CPU work) and stream frame batches through a
+        small bounded pipe (one pickle per batch, no broker process); CLIP and FAISS stay in this process, so the model is loaded
+        once and the GPU has a single user. Each in-flight video keeps its own
+        duplicate detector.
+        
+        Args:
+            video_files: Videos to process
+            num_workers: Number of decode worker processes
+        """
+        workers = min(num_workers, len(video_files))
+        logger.info(f"Decoding videos with {workers} worker processes")
+        runs: Dict[str, _VideoRun] = {}
+        idle_detectors = [self.duplicate_detector]
+
+        # Spawn rather than fork: this process may already hold a CUDA context
+        ctx = multiprocessing.get_context("spawn")
+        # Bounded so decoders cannot run far ahead of the GPU
+        queue = ctx.Queue(maxsize=DECODE_QUEUE_BATCHES)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=decode_worker.init_worker, initargs=(queue,)) as pool:
+            pending = set()
+            futures = []
+            for video_path in video_files:
+                if video_path.name in self.processed_videos:
+                    logger.warning(f"Video {video_path.name} already processed, skipping")
+                    continue
+                pending.add(str(video_path))
+                futures.append(pool.submit(
+                    decode_worker.decode_video_batches,
+                    str(video_path),
+                    self.frame_extraction_fps,
+                    self.batch_size,
+                    settings.VIDEO_DECODER,
+                    settings.VIDEO_HWACCEL
+                ))
+
+            while pending:
+                try:
+                    message = queue.get(timeout=1.0)
+                except Empty:
+                    if not all(future.done() for future in futures):
+                        continue
+                    # Workers may have put their last messages between the timeout and the check above
+                    while True:
+                        try:
+                            message = queue.get_nowait()
+                        except Empty:
+                            break
+                        self._handle_decoded_batch(message, runs, pending, idle_detectors)
+                    if pending:
+                        # A worker died without reporting (e.g. the process was killed)
+                        logger.error(f"Decode workers exited before finishing: {sorted(pending)}")
+                    break
+                self._handle_decoded_batch(message, runs, pending, idle_detectors)
+
+    def _handle_decoded_batch(self,
+                              message: Tuple[str, Optional[List[np.ndarray]], Optional[List[float]], Optional[np.ndarray], Optional[str]],
+                              runs: Dict[str, _VideoRun],
+                              pending: set,
+                              idle_detectors: List[DuplicateDetector]) -> None:
+        """Consume one (video_path, frames, timestamps, hashes, error) message from a decode worker."""
+        video_path, frames, timestamps, hashes, error = message
+        run = runs.get(video_path)
+        if run is None:
+            detector = idle_detectors.pop() if idle_detectors else self._new_duplicate_detector()
+            detector.clear()
+            run = runs[video_path] = _VideoRun(Path(video_path).name, detector)
+            logger.info(f"Processing video: {run.video_name}")
+
+        if frames is not None:
+            if run.failed:
+                return
+            try:
+                self._consume_frames(run, frames, timestamps, hashes)
+            except Exception as e:
+                logger.error(f"Unexpected error processing video {run.video_name}: {e}", exc_info=True)
+                run.failed = True
+            return
+
+        # End of this video
+        pending.discard(video_path)
+        del runs[video_path]
+        idle_detectors.append(run.duplicate_detector)
+        if error is not None:
+            logger.error(f"Skipping video {run.video_name} due to error: {error}")
+        elif not run.failed:
+            try:
+                self._finish_video(run)
+            except Exception as e:
+                logger.error(f"Unexpected error processing video {run.video_name}: {e}", exc_info=True)
+
+    def process_all_videos(self, video_dir_override: Optional[Path] = None, allowed_extensions_override: Optional[List[str]] = None,
+                           num_workers_override: Optional[int] = None) -> None:
         """Process all videos in the specified video directory."""
         process_dir = video_dir_override if video_dir_override else self.video_dir
         allowed_ext = allowed_extensions_override if allowed_extensions_override else self.allowed_extensions
+        num_workers = num_workers_override if num_workers_override else settings.NUM_DECODE_WORKERS
 
         logger.info(f"Searching for videos in: {process_dir} with extensions {allowed_ext}")
-        # Use glob with '**/*' for recursive search
-        video_files = [f for f in process_dir.glob("**/*") if f.is_file() and f.suffix.lower() in allowed_ext]
+        # One recursive walk, filtering on the name before building any Path;
+        # os.walk lists directories separately, so no per-file is_file() stat is needed
+        allowed = {ext.lower() for ext in allowed_ext}
+        video_files = [
+            Path(root) / name
+            for root, _, files in os.walk(process_dir)
+            for name in files
+            if os.path.splitext(name)[1].lower() in allowed
+        ]
 
         if not video_files:
             logger.warning(f"No videos found in {process_dir} with specified extensions.")
@@ -212,12 +437,15 @@ class VideoProcessor:
             
         logger.info(f"Found {len(video_files)} videos to process")
         
-        for video_path in video_files:
-            try:
-                self.process_video(str(video_path))
-            except Exception as e:
-                logger.error(f"Failed processing {video_path.name}: {e}", exc_info=True)
-                continue
+        if num_workers > 1 and len(video_files) > 1:
+            self._process_videos_parallel(video_files, num_workers)
+        else:
+            for video_path in video_files:
+                try:
+                    self.process_video(str(video_path))
+                except Exception as e:
+                    logger.error(f"Failed processing {video_path.name}: {e}", exc_info=True)
+                    continue
         
         # Log final summary
         logger.info("\nProcessing Summary:")
@@ -227,10 +455,13 @@ class VideoProcessor:
 
     def finalize_processing(self):
         """Save the FAISS index after processing all videos."""
+        self._wait_for_frame_saves()
         # Check if there's anything to save
         if self.total_frames_stored > 0:
             logger.info("Finalizing processing and saving FAISS index...")
-            self.faiss_service.save_index()
+            # Once per run rather than inside a store call: training a large IVF index takes minutes
+            self.faiss_service.maybe_convert_to_ivf()
+            self.faiss_service.save_index_blocking()
             logger.info("FAISS index saved.")
         else:
             logger.warning("Skipping saving FAISS index as no new frames were stored.")
\ No newline at end of file
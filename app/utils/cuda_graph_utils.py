@@ -0,0 +1,100 @@
+"""CUDA Graph replay for batched CLIP image embeddings.
+
+The image tower is captured once per stream at the ingest batch size and then
+replayed, so each call is a copy into a static input buffer plus a single graph
+launch instead of one dispatch per kernel. Smaller batches (e.g. the last one of
+a video) are padded into the static input.
+"""
+
+import itertools
+import logging
+import threading
+from typing import List
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Eager iterations on the capture stream before capturing (lets cuDNN/cuBLAS pick algorithms)
+_WARMUP_ITERS = 3
+
+
+class _GraphSlot:
+    """One captured graph with its own stream and static input/output buffers."""
+
+    def __init__(self, model, static_input: torch.Tensor):
+        self.lock = threading.Lock()
+        self.stream = torch.cuda.Stream(static_input.device)
+        self.static_input = static_input
+        self.graph = torch.cuda.CUDAGraph()
+
+        self.stream.wait_stream(torch.cuda.current_stream(static_input.device))
+        with torch.cuda.stream(self.stream), torch.inference_mode():
+            for _ in range(_WARMUP_ITERS):
+                model.get_image_features(pixel_values=self.static_input)
+            with torch.cuda.graph(self.graph, stream=self.stream):
+                self.static_output = model.get_image_features(pixel_values=self.static_input)
+        torch.cuda.current_stream(static_input.device).wait_stream(self.stream)
+
+
+class CUDAGraphImageEncoder:
+    """
+    Pool of CUDA Graphs capturing CLIPModel.get_image_features for a fixed batch size.
+
+    Each slot has its own stream and static buffers, so concurrent callers
+    replay on different streams instead of serializing on the default one.
+    """
+
+    def __init__(self, model, device: torch.device, dtype: torch.dtype, batch_size: int, num_streams: int = 1):
+        """
+        Capture the image tower once per stream.
+
+        Args:
+            model: CLIP model (not torch.compile'd; reduce-overhead already uses CUDA Graphs)
+            device: CUDA device the model is on
+            dtype: dtype of the model's pixel values
+            batch_size: Largest batch the graphs accept; smaller batches are padded
+            num_streams: Number of streams/graphs to round-robin over
+        """
+        image_size = model.config.vision_config.image_size
+        self.input_shape = (batch_size, 3, image_size, image_size)
+        self._slots: List[_GraphSlot] = [
+            _GraphSlot(model, torch.zeros(self.input_shape, device=device, dtype=dtype))
+            for _ in range(max(1, num_streams))
+        ]
+        self._next_slot = itertools.cycle(self._slots)
+        self._next_slot_lock = threading.Lock()
+        logger.info(f"Captured CLIP image encoder CUDA graphs on {len(self._slots)} streams")
+
+    def accepts(self, pixel_values: torch.Tensor) -> bool:
+        """Whether a batch fits the captured graphs (same crop size, at most batch_size images)."""
+        return (0 < pixel_values.shape[0] <= self.input_shape[0]
+                and tuple(pixel_values.shape[1:]) == self.input_shape[1:])
+
+    def get_image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Replay the captured forward pass.
+
+        Args:
+            pixel_values: (n, 3, image_size, image_size) tensor on the model's device, n <= batch_size
+
+        Returns:
+            (n, dim) projected image embeddings (not normalized), owned by the caller
+        """
+        n = pixel_values.shape[0]
+        with self._next_slot_lock:
+            slot = next(self._next_slot)
+        current_stream = torch.cuda.current_stream(pixel_values.device)
+        with slot.lock:
+            # The input was produced on the caller's stream; the copy must wait for it
+            slot.stream.wait_stream(current_stream)
+            with torch.cuda.stream(slot.stream):
+                # Rows past n keep the previous batch's pixels; images are independent, so
+                # they only cost compute and their outputs are dropped
+                slot.static_input[:n].copy_(pixel_values, non_blocking=True)
+                slot.graph.replay()
+                # Clone before releasing the slot, as the next replay overwrites static_output
+                output = slot.static_output[:n].clone()
+            current_stream.wait_stream(slot.stream)
+        output.record_stream(current_stream)
+        return output
@@ -1,19 +1,38 @@
+import logging
+import threading
 import numpy as np
-import cv2
-from PIL import Image
-import imagehash
 from typing import List, Tuple, Optional, Dict
 import faiss
 from transformers import CLIPModel, CLIPProcessor
 from app.core.config import settings
+from app.utils.image_ops import PerceptualHasher
+from app.utils.vector_ops import dot_window, hamming_distances
+
+logger = logging.getLogger(__name__)
+
+# One set of FAISS GPU resources for all detectors: each StandardGpuResources reserves its own
+# temporary-memory pool (a share of VRAM), and parallel processing creates a detector per video
+_GPU_RESOURCES = None
+_GPU_RESOURCES_LOCK = threading.Lock()
+
+
+def _shared_gpu_resources() -> "faiss.StandardGpuResources":
+    """Return the process-wide FAISS GPU resources, creating them on first use."""
+    global _GPU_RESOURCES
+    with _GPU_RESOURCES_LOCK:
+        if _GPU_RESOURCES is None:
+            _GPU_RESOURCES = faiss.StandardGpuResources()
+        return _GPU_RESOURCES
+
 
 class DuplicateDetector:
     # Constants
     RECENT_HASH_CHECK_COUNT = 5
-    LSH_SEARCH_K = 10
-    LSH_UPDATE_FREQUENCY = 100
-    LSH_BITS = 8
+    ANN_SEARCH_K = 10
+    HNSW_M = 32
+    HNSW_EF_SEARCH = 32
     EMBEDDING_DIM = 768
+    INITIAL_EMBEDDING_CAPACITY = 1024
     
     def __init__(self,
                  clip_model: CLIPModel,
@@ -33,52 +52,92 @@ class DuplicateDetector:
         self.clip_processor = clip_processor
         self.hash_threshold = hash_threshold
         self.window_size = window_size
-        self.recent_frames: List[Dict[str, imagehash.ImageHash]] = []
-        self.frame_embeddings: List[np.ndarray] = []
-        self.lsh_index: Optional[faiss.IndexLSH] = None
-
-    def compute_image_hash(self, image: np.ndarray) -> imagehash.ImageHash:
-        """Compute perceptual hash for an image."""
-        # Convert from BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        # Convert to PIL image
-        pil_image = Image.fromarray(rgb_image)
-        # Compute the hash
-        return imagehash.phash(pil_image)
-
-    def hash_difference(self, hash1: imagehash.ImageHash, hash2: imagehash.ImageHash) -> int:
-        """Calculate the difference between two perceptual hashes."""
-        # The hash objects from imagehash have a built-in comparison operator
-        return hash1 - hash2
-
-    def is_similar_to_any(self, embedding: np.ndarray, existing_embeddings: List[np.ndarray]) -> bool:
-        """Check if an embedding is similar to any in the list."""
-        if not existing_embeddings:
+        # SIMILARITY_THRESHOLD applies to (cos + 1) / 2; compare raw cosine against the equivalent bound
+        self._sim_thresh_raw = 2 * settings.SIMILARITY_THRESHOLD - 1
+        self.recent_hashes = np.empty(0, dtype=np.uint64)
+        self._hasher = PerceptualHasher()
+        # Unique-frame embeddings live in rows [0, _emb_n) of a buffer that doubles when full.
+        # Stored as float16 (half the memory traffic); slices are upcast to float32 for the dot products
+        self._emb_buf = np.empty((self.INITIAL_EMBEDDING_CAPACITY, self.EMBEDDING_DIM), dtype=np.float16)
+        self._emb_n = 0
+        # Float32 ring of the last window_size embeddings: the hot per-frame check reads it as-is,
+        # with no slicing or upcast of the float16 buffer (row order does not matter for it)
+        self._ring = np.empty((self.window_size, self.EMBEDDING_DIM), dtype=np.float32)
+        self._ring_n = 0
+        self._ring_pos = 0
+        # Exact inner-product search on the GPU when available, HNSW on the CPU otherwise
+        self._gpu_resources = None
+        if settings.CLIP_DEVICE == "cuda" and hasattr(faiss, "StandardGpuResources"):
+            self._gpu_resources = _shared_gpu_resources()
+        self._ann_on_gpu = False
+        self.ann_index = self._new_ann_index()
+
+    def compute_image_hash(self, image: np.ndarray) -> np.uint64:
+        """Compute a 64-bit perceptual hash (DCT pHash) for a BGR image."""
+        return self._hasher(image)
+
+    def hash_difference(self, hash1: np.uint64, hash2: np.uint64) -> int:
+        """Calculate the Hamming distance between two perceptual hashes."""
+        return bin(int(hash1 ^ hash2)).count("1")
+
+    def is_similar_to_any(self, embedding: np.ndarray, existing_embeddings: np.ndarray) -> bool:
+        """Check if an embedding is similar to any row of a (n, dim) float16/float32 matrix."""
+        if not len(existing_embeddings):
             return False
-            
-        # Convert to numpy array if not already
-        existing_embeddings_array = np.array(existing_embeddings)
         
         # Calculate cosine similarities
         # For normalized vectors, dot product equals cosine similarity
-        similarities = np.dot(existing_embeddings_array, embedding)
+        similarities = dot_window(embedding, existing_embeddings)
         
-        # Scale similarity to better range (0.5-1.0 → 0.0-1.0)
-        similarities = (similarities + 1) / 2
-        
-        return bool(np.any(similarities > settings.SIMILARITY_THRESHOLD))
+        return bool(np.any(similarities > self._sim_thresh_raw))
+
+    @property
+    def frame_embeddings(self) -> np.ndarray:
+        """View of the stored unique-frame embeddings (no copy)."""
+        return self._emb_buf[:self._emb_n]
+
+    def _append_embedding(self, embedding: np.ndarray) -> None:
+        """Append one embedding row, doubling the buffer when it is full."""
+        if self._emb_n == self._emb_buf.shape[0]:
+            grown = np.empty((2 * self._emb_buf.shape[0], self.EMBEDDING_DIM), dtype=self._emb_buf.dtype)
+            grown[:self._emb_n] = self._emb_buf[:self._emb_n]
+            self._emb_buf = grown
+        self._emb_buf[self._emb_n] = embedding
+        self._emb_n += 1
+        if self.window_size > 0:
+            self._ring[self._ring_pos] = embedding
+            self._ring_pos = (self._ring_pos + 1) % self.window_size
+            self._ring_n = min(self._ring_n + 1, self.window_size)
+
+    def _new_cpu_ann_index(self) -> faiss.IndexHNSWFlat:
+        """Create an empty HNSW index; inner product equals cosine for normalized embeddings."""
+        index = faiss.IndexHNSWFlat(self.EMBEDDING_DIM, self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        return index
 
-    def update_lsh_index(self):
-        """Update LSH index for efficient similarity search."""
-        if not self.frame_embeddings:
+    def _new_ann_index(self) -> faiss.Index:
+        """Create an empty ANN index, on GPU 0 if a GPU-enabled FAISS build is running on CUDA."""
+        self._ann_on_gpu = False
+        if self._gpu_resources is not None:
+            try:
+                index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, faiss.IndexFlatIP(self.EMBEDDING_DIM))
+                self._ann_on_gpu = True
+                return index
+            except Exception as e:
+                logger.warning(f"Could not create duplicate-detection index on GPU, using CPU: {e}")
+                self._gpu_resources = None
+        return self._new_cpu_ann_index()
+
+    def _add_to_ann_index(self, embeddings: np.ndarray) -> None:
+        """Add accepted embeddings, moving the index to CPU once it outgrows DEDUP_GPU_MAX_VECTORS."""
+        if self._ann_on_gpu and self.ann_index.ntotal + len(embeddings) > settings.DEDUP_GPU_MAX_VECTORS:
+            logger.info(f"Duplicate-detection index exceeds {settings.DEDUP_GPU_MAX_VECTORS} vectors, moving it to CPU")
+            # The buffer already holds every accepted embedding, including these
+            self.ann_index = self._new_cpu_ann_index()
+            self._ann_on_gpu = False
+            self.ann_index.add(self.frame_embeddings.astype(np.float32))
             return
-            
-        # Convert embeddings to float32 for FAISS
-        embeddings_array = np.array(self.frame_embeddings).astype('float32')
-        
-        # Create LSH index
-        self.lsh_index = faiss.IndexLSH(self.EMBEDDING_DIM, self.LSH_BITS)  # Use constants
-        self.lsh_index.add(embeddings_array)
+        self.ann_index.add(embeddings)
 
     def is_duplicate(self, frame: np.ndarray, frame_embedding: np.ndarray) -> Tuple[bool, Optional[np.ndarray]]:
         """
@@ -92,44 +151,88 @@ class DuplicateDetector:
             Tuple (is_duplicate: bool, embedding: Optional[np.ndarray]).
             The embedding is returned only if is_duplicate is False.
         """
+        frame_embedding = np.asarray(frame_embedding, dtype=np.float32).reshape(1, -1)
+        return self.is_duplicate_batch([frame], frame_embedding)[0]
+
+    def is_duplicate_batch(self,
+                           frames: List[np.ndarray],
+                           frame_embeddings: np.ndarray,
+                           frame_hashes: Optional[np.ndarray] = None) -> List[Tuple[bool, Optional[np.ndarray]]]:
+        """
+        Check a batch of consecutive frames for duplicates with a single ANN search.
+        
+        Decisions are made in frame order, so a frame can be a duplicate of an earlier
+        frame from the same batch.
+        
+        Args:
+            frames: The frames to check
+            frame_embeddings: (len(frames), dim) pre-generated CLIP embeddings
+            frame_hashes: Optional pre-computed perceptual hashes, one per frame
+            
+        Returns:
+            One (is_duplicate, embedding) tuple per frame, as returned by is_duplicate.
+        """
+        frame_embeddings = np.ascontiguousarray(frame_embeddings, dtype=np.float32)
+        batch_start = self._emb_n
+
+        # One k-NN search for the whole batch against the frames accepted before it; below the
+        # window size every earlier row is compared exactly instead (see _check_frame)
+        candidates = None
+        if batch_start > self.window_size:
+            _, candidates = self.ann_index.search(frame_embeddings, self.ANN_SEARCH_K)
+
+        results = []
+        for row, (frame, frame_embedding) in enumerate(zip(frames, frame_embeddings)):
+            row_candidates = None if candidates is None else candidates[row]
+            frame_hash = self.compute_image_hash(frame) if frame_hashes is None else frame_hashes[row]
+            results.append(self._check_frame(frame_hash, frame_embedding, batch_start, row_candidates))
+
+        # The index gets the full-precision embeddings, not the float16 copies
+        accepted = [embedding for is_dup, embedding in results if not is_dup]
+        if accepted:
+            self._add_to_ann_index(np.stack(accepted))
+        return results
+
+    def _check_frame(self,
+                     frame_hash: np.uint64,
+                     frame_embedding: np.ndarray,
+                     batch_start: int,
+                     candidates: Optional[np.ndarray]) -> Tuple[bool, Optional[np.ndarray]]:
+        """Run both detection stages for one frame of a batch and record it if unique."""
         # Stage 1: Quick perceptual hash check with recent frames
-        frame_hash = self.compute_image_hash(frame)
-        for recent_frame in self.recent_frames[-self.RECENT_HASH_CHECK_COUNT:]:
-            if self.hash_difference(frame_hash, recent_frame['hash']) < self.hash_threshold:
-                return True, None
+        if self.recent_hashes.size and hamming_distances(self.recent_hashes, frame_hash).min() < self.hash_threshold:
+            return True, None
 
         # Stage 2: CLIP embedding comparison
-        # Check against recent frames first (temporal locality)
-        recent_embeddings = self.frame_embeddings[-self.window_size:]
-        if self.is_similar_to_any(frame_embedding, recent_embeddings):
+        # Check recent frames first (temporal locality)
+        if self.is_similar_to_any(frame_embedding, self._ring[:self._ring_n]):
+            return True, None
+        # Rows that already left the ring and are not covered by the ANN results: frames accepted
+        # earlier in this batch, plus (when the batch skipped the ANN search) pre-batch rows pushed
+        # out of the ring by them. Without a search batch_start <= window_size, so this stays small.
+        overflow_start = batch_start if candidates is not None else 0
+        overflow_stop = self._emb_n - self._ring_n
+        if overflow_stop > overflow_start and self.is_similar_to_any(frame_embedding, self._emb_buf[overflow_start:overflow_stop]):
             return True, None
 
-        # If not found in recent frames, use LSH for approximate search
-        if len(self.frame_embeddings) > self.window_size:
-            if self.lsh_index is None or len(self.frame_embeddings) % self.LSH_UPDATE_FREQUENCY == 0:
-                self.update_lsh_index()
-
-            if self.lsh_index:
-                # Search using LSH index
-                distances, indices = self.lsh_index.search(
-                    np.array([frame_embedding]).astype('float32'),
-                    k=self.LSH_SEARCH_K
-                )
-
-                # Check potential matches
-                potential_matches = [self.frame_embeddings[i] for i in indices[0] if 0 <= i < len(self.frame_embeddings)]
-                if self.is_similar_to_any(frame_embedding, potential_matches):
-                    return True, None
+        # Then the approximate neighbours found by the batch search
+        if candidates is not None:
+            potential_matches = self._emb_buf[candidates[(candidates >= 0) & (candidates < batch_start)]]
+            if self.is_similar_to_any(frame_embedding, potential_matches):
+                return True, None
 
-        # Not a duplicate - add to our collections
-        self.recent_frames.append({'hash': frame_hash})
-        self.frame_embeddings.append(frame_embedding)
+        # Not a duplicate - add to our collections (the ANN index is updated once per batch)
+        # Only the last RECENT_HASH_CHECK_COUNT hashes are ever compared against
+        self.recent_hashes = np.concatenate((self.recent_hashes, [frame_hash]))[-self.RECENT_HASH_CHECK_COUNT:]
+        self._append_embedding(frame_embedding)
 
         # Return False (not duplicate) and the embedding
         return False, frame_embedding
 
     def clear(self):
         """Clear all stored data."""
-        self.recent_frames = []
-        self.frame_embeddings = []
-        self.lsh_index = None 
\ No newline at end of file
+        self.recent_hashes = np.empty(0, dtype=np.uint64)
+        self._emb_n = 0
+        self._ring_n = 0
+        self._ring_pos = 0
+        self.ann_index = self._new_ann_index() 
\ No newline at end of file
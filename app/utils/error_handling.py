@@ -51,12 +51,7 @@ def handle_errors(
         @functools.wraps(func)
         def sync_wrapper(*args, **kwargs) -> T:
             try:
-                # Get the function's signature
-                sig = inspect.signature(func)
-                # Bind the arguments to the function's parameters
-                bound_args = sig.bind(*args, **kwargs)
-                # Apply the bound arguments
-                return func(*bound_args.args, **bound_args.kwargs)
+                return func(*args, **kwargs)
             except Exception as e:
                 full_error = f"{error_message}: {str(e)}"
                 if log_traceback:
@@ -79,12 +74,7 @@ def handle_errors(
         @functools.wraps(func)
         async def async_wrapper(*args, **kwargs) -> T:
             try:
-                # Get the function's signature
-                sig = inspect.signature(func)
-                # Bind the arguments to the function's parameters
-                bound_args = sig.bind(*args, **kwargs)
-                # Apply the bound arguments
-                return await func(*bound_args.args, **bound_args.kwargs)
+                return await func(*args, **kwargs)
             except Exception as e:
                 full_error = f"{error_message}: {str(e)}"
                 if log_traceback:
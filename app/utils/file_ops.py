@@ -57,17 +57,22 @@ def load_state(file_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
 
 
 @contextmanager
-def temporary_file(suffix: str = '.tmp') -> Path:
+def temporary_file(suffix: str = '.tmp', directory: Optional[Union[str, Path]] = None) -> Path:
     """
     Context manager for creating and cleaning up temporary files.
     
+    A file that was moved away (e.g. with os.replace) before the context exits
+    is left alone, which makes this the building block for atomic writes.
+    
     Args:
         suffix: File suffix (extension)
+        directory: Directory to create the file in (defaults to the system temp dir).
+            Use the target's directory for atomic replaces, which cannot cross filesystems.
         
     Yields:
         Path object for the temporary file
     """
-    temp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    temp_file = tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False)
     temp_path = Path(temp_file.name)
     try:
         temp_file.close()
@@ -1,11 +1,28 @@
 """Image and video frame processing utilities."""
 
 import cv2
+import itertools
+import logging
 import numpy as np
 from contextlib import contextmanager
-from typing import List, Tuple, Optional, Union
+from typing import Iterator, List, Tuple, Optional, Union
 from pathlib import Path
 
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    PYAV_AVAILABLE = False
+
+try:
+    from turbojpeg import TurboJPEG
+    _TURBOJPEG = TurboJPEG()
+except Exception:
+    # Not installed, or the libjpeg-turbo shared library could not be found
+    _TURBOJPEG = None
+
+logger = logging.getLogger(__name__)
+
 
 @contextmanager
 def video_capture(video_path: Union[str, Path]):
@@ -27,65 +44,232 @@ def video_capture(video_path: Union[str, Path]):
         cap.release()
 
 
+def _open_pyav(video_path: Union[str, Path], hwaccel: Optional[str]):
+    """
+    Open a video with PyAV, using a hardware decoder when one is requested and supported.
+    
+    Args:
+        video_path: Path to the video file
+        hwaccel: FFmpeg hardware device type (e.g. 'cuda', 'vaapi'), or None for CPU decoding
+        
+    Returns:
+        Open PyAV input container
+    """
+    if hwaccel:
+        try:
+            # HWAccel is only available in PyAV >= 14
+            from av.codec.hwaccel import HWAccel
+            return av.open(str(video_path), hwaccel=HWAccel(device_type=hwaccel, allow_software_fallback=True))
+        except Exception as e:
+            logger.warning(f"Hardware decoding ({hwaccel}) unavailable, decoding {video_path} on CPU: {e}")
+    return av.open(str(video_path))
+
+
+class _TimestampSampler:
+    """
+    Pick frames at a target FPS from their timestamps.
+
+    Both decoders use it, so the extracted frames (and their indices) do not
+    depend on which decoder is installed.
+    """
+
+    def __init__(self, fps: float):
+        self.time_interval = 1.0 / fps  # Time gap between frames to capture
+        self.next_capture_time = 0.0
+
+    def take(self, frame_time: float) -> bool:
+        """Return True if the frame at `frame_time` (seconds) should be captured."""
+        if frame_time < self.next_capture_time:
+            return False
+        # Stay on the fps grid; after a gap (e.g. missing frames) restart from this frame
+        self.next_capture_time += self.time_interval
+        if self.next_capture_time <= frame_time:
+            self.next_capture_time = frame_time + self.time_interval
+        return True
+
+
+def _iter_frames_pyav(container, fps: float) -> Iterator[Tuple[np.ndarray, float]]:
+    """Yield (BGR frame, timestamp in seconds) sampled at `fps`, closing the container at the end."""
+    sampler = _TimestampSampler(fps)
+    try:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO" # Frame + slice threading in the software decoder
+        video_rate = stream.average_rate or stream.guessed_rate
+        for index, frame in enumerate(container.decode(stream)):
+            frame_time = frame.time
+            if frame_time is None:
+                # No usable pts in this container; derive the time from the frame rate
+                if not video_rate:
+                    raise ValueError("Could not read FPS or frame timestamps from video")
+                frame_time = index / float(video_rate)
+            # Skipped frames are never converted
+            if not sampler.take(frame_time):
+                continue
+            # BGR keeps the rest of the pipeline (hashing, saving) identical to the OpenCV path
+            yield frame.to_ndarray(format="bgr24"), float(frame_time)
+    finally:
+        container.close()
+
+
+def _iter_frames_opencv(video_path: Union[str, Path], fps: float) -> Iterator[Tuple[np.ndarray, float]]:
+    """Yield (BGR frame, timestamp in seconds) sampled at `fps`."""
+    sampler = _TimestampSampler(fps)
+    with video_capture(video_path) as cap:
+        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        if video_fps <= 0:
+            raise ValueError(f"Could not read FPS from video: {video_path}")
+
+        # grab() decodes a frame without retrieving (converting and copying) it
+        for index in itertools.count():
+            if not cap.grab():
+                break  # End of video
+            frame_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if frame_time <= 0 and index > 0:
+                # Backend does not report positions; derive the time from the frame rate
+                frame_time = index / video_fps
+            if not sampler.take(frame_time):
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield frame, frame_time
+
+
+def _decoded_frames(
+    video_path: Union[str, Path],
+    fps: float,
+    decoder: str,
+    hwaccel: Optional[str]
+) -> Iterator[Tuple[np.ndarray, float]]:
+    """Pick the frame decoder: PyAV when installed (and not disabled), OpenCV otherwise."""
+    if decoder != "opencv" and PYAV_AVAILABLE:
+        try:
+            return _iter_frames_pyav(_open_pyav(video_path, hwaccel), fps)
+        except Exception as e:
+            if decoder == "pyav":
+                raise ValueError(f"Failed to open video file: {video_path}: {e}") from e
+            logger.warning(f"PyAV could not open {video_path}, falling back to OpenCV: {e}")
+    elif decoder == "pyav":
+        logger.warning("VIDEO_DECODER is 'pyav' but PyAV is not installed; using OpenCV")
+    return _iter_frames_opencv(video_path, fps)
+
+
+def estimate_extracted_frame_count(video_path: Union[str, Path], fps: float) -> Optional[int]:
+    """
+    Estimate how many frames extract_frames will yield, from the container header.
+    
+    Args:
+        video_path: Path to video file
+        fps: Target frames per second to extract
+        
+    Returns:
+        Estimated frame count, or None if the header does not tell
+    """
+    try:
+        with video_capture(video_path) as cap:
+            frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+            video_fps = cap.get(cv2.CAP_PROP_FPS)
+    except ValueError:
+        return None
+    if frame_count <= 0 or video_fps <= 0:
+        return None
+    return int(frame_count / video_fps * min(fps, video_fps)) + 1
+
+
 def extract_frames(
     video_path: Union[str, Path],
     fps: float,
-    max_frames: Optional[int] = None
-) -> Tuple[List[np.ndarray], List[float]]:
+    max_frames: Optional[int] = None,
+    decoder: str = "auto",
+    hwaccel: Optional[str] = None
+) -> Iterator[Tuple[np.ndarray, float]]:
     """
     Extract frames from a video sequentially at a target FPS.
 
+    Frames are yielded as they are decoded, so callers can process a video
+    of any length in constant memory.
+
     Args:
         video_path: Path to video file
         fps: Target frames per second to extract
         max_frames: Maximum number of frames to extract
+        decoder: 'auto' (PyAV if installed, else OpenCV), 'pyav' or 'opencv'
+        hwaccel: Hardware device type for PyAV decoding (e.g. 'cuda'), or None
 
-    Returns:
-        Tuple of (frames, timestamps)
+    Yields:
+        Tuple of (frame, timestamp in seconds)
     """
-    frames = []
-    timestamps = []
-    frame_count = 0
-    time_interval = 1.0 / fps  # Time gap between frames to capture
-    next_capture_time = 0.0
+    # The decoders sample at the target FPS themselves, skipping unwanted frames as early as they can
+    frames = _decoded_frames(video_path, fps, decoder, hwaccel)
+    if max_frames is not None:
+        frames = itertools.islice(frames, max_frames)
+    yield from frames
 
-    with video_capture(video_path) as cap:
-        video_fps = cap.get(cv2.CAP_PROP_FPS)
-        if video_fps <= 0:
-            raise ValueError(f"Could not read FPS from video: {video_path}")
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break  # End of video
+class PerceptualHasher:
+    """Compute 64-bit DCT perceptual hashes (pHash), reusing scratch buffers between frames."""
 
-            # Get current timestamp in seconds
-            current_timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+    def __init__(self):
+        # The gray buffer is sized on the first frame
+        self._gray_buf: Optional[np.ndarray] = None
+        self._small_buf = np.empty((32, 32), dtype=np.uint8)
+        self._small_f32_buf = np.empty((32, 32), dtype=np.float32)
+        self._dct_buf = np.empty((32, 32), dtype=np.float32)
 
-            # Capture frame if it's at or after the next capture time
-            if current_timestamp >= next_capture_time:
-                frames.append(frame)
-                timestamps.append(current_timestamp)
-                frame_count += 1
-                next_capture_time = current_timestamp + time_interval
+    def __call__(self, image: np.ndarray) -> np.uint64:
+        """
+        Hash a BGR image.
+        
+        Args:
+            image: Image as numpy array (BGR format from OpenCV)
+            
+        Returns:
+            The hash packed into a numpy uint64
+        """
+        # Grayscale 32x32 thumbnail, then the low-frequency 8x8 corner of its DCT
+        # Written into preallocated buffers so no per-frame images are allocated
+        if self._gray_buf is None or self._gray_buf.shape != image.shape[:2]:
+            self._gray_buf = np.empty(image.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self._gray_buf)
+        cv2.resize(self._gray_buf, (32, 32), dst=self._small_buf, interpolation=cv2.INTER_AREA)
+        self._small_f32_buf[...] = self._small_buf
+        cv2.dct(self._small_f32_buf, dst=self._dct_buf)
+        block = self._dct_buf[:8, :8].flatten()
+        # One bit per coefficient: above the median of the AC terms (DC excluded)
+        bits = block > np.median(block[1:])
+        return np.packbits(bits).view(np.uint64)[0]
 
-                # Stop if max_frames reached
-                if max_frames is not None and frame_count >= max_frames:
-                    break
 
-    return frames, timestamps
+def encode_jpeg(frame: np.ndarray, quality: int = 95) -> bytes:
+    """
+    Encode a BGR frame as JPEG, with libjpeg-turbo (PyTurboJPEG) when available.
+    
+    Args:
+        frame: Frame to encode (BGR format from OpenCV)
+        quality: JPEG quality (0-100)
+        
+    Returns:
+        The encoded JPEG bytes
+    """
+    if _TURBOJPEG is not None:
+        return _TURBOJPEG.encode(frame, quality=quality)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode frame as JPEG")
+    return buffer.tobytes()
 
 
-def save_frame(frame: np.ndarray, output_path: Union[str, Path]) -> None:
+def save_frame(frame: np.ndarray, output_path: Union[str, Path], quality: int = 95) -> None:
     """
-    Save a frame to disk.
+    Save a frame to disk as JPEG.
     
     Args:
         frame: Frame to save
         output_path: Path to save frame to
+        quality: JPEG quality (0-100)
     """
     # Ensure the parent directory exists (optional, but good practice)
     # path = Path(output_path)
     # path.parent.mkdir(parents=True, exist_ok=True)
     
-    cv2.imwrite(str(output_path), frame)
\ No newline at end of file
+    Path(output_path).write_bytes(encode_jpeg(frame, quality))
\ No newline at end of file
@@ -1,15 +1,40 @@
 """Machine learning model utilities."""
 
 import torch
+import torch.nn.functional as F
 import numpy as np
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, Any, List, Tuple, Optional, Union
 from transformers import CLIPProcessor, CLIPModel
 
+from app.core.config import settings
+from app.utils.cuda_graph_utils import CUDAGraphImageEncoder
+
 logger = logging.getLogger(__name__)
 
-# Cache for loaded models to prevent redundant loading
-_MODEL_CACHE: Dict[str, Tuple[CLIPModel, CLIPProcessor]] = {}
+# LRU cache for loaded models to prevent redundant loading. _MODEL_CACHE_LOCK only guards
+# lookups and inserts; loads hold a per-key lock, so concurrent first calls for one model
+# wait for a single load while hits for other models are not blocked by it
+_MODEL_CACHE: "OrderedDict[str, Tuple[CLIPModel, CLIPProcessor]]" = OrderedDict()
+_MODEL_CACHE_LOCK = threading.Lock()
+_MODEL_LOAD_LOCKS: Dict[str, threading.Lock] = {}
+
+# LRU of text embeddings keyed on (id(model), text); entries are read-only float32 rows
+_TEXT_EMBEDDING_CACHE: "OrderedDict[Tuple[int, str], np.ndarray]" = OrderedDict()
+_TEXT_EMBEDDING_CACHE_LOCK = threading.Lock()
+
+# One reusable pinned host buffer for H2D copies per thread (concurrent callers must not share one),
+# held as (buffer, event recorded after its last upload) and replaced when the shape changes
+_PINNED_STAGING = threading.local()
+# Below this size (e.g. text token ids) a plain copy is cheaper than staging through pinned memory
+_PIN_MIN_BYTES = 1 << 20
+# Page-locked memory is taken from the OS for good; larger uploads fall back to a plain copy
+_PIN_MAX_BYTES = 256 << 20
+
+# Preprocessing constants per (processor, device), so mean/std tensors are built once rather than per batch
+_TRANSFORM_CACHE: Dict[Tuple[int, str], Tuple[int, int, int, torch.Tensor, torch.Tensor]] = {}
 
 
 def load_clip_model(model_name: str, device: str) -> Tuple[CLIPModel, CLIPProcessor]:
@@ -23,27 +48,148 @@ def load_clip_model(model_name: str, device: str) -> Tuple[CLIPModel, CLIPProces
     Returns:
         Tuple of (model, processor)
     """
-    cache_key = f"{model_name}_{device}"
+    cache_key = f"{model_name}_{device}_compiled" if settings.CLIP_COMPILE else f"{model_name}_{device}"
+    
+    with _MODEL_CACHE_LOCK:
+        cached = _cached_model(cache_key, model_name)
+        if cached is not None:
+            return cached
+        load_lock = _MODEL_LOAD_LOCKS.setdefault(cache_key, threading.Lock())
     
-    if cache_key in _MODEL_CACHE:
+    with load_lock:
+        # Another thread may have finished loading it while this one waited
+        with _MODEL_CACHE_LOCK:
+            cached = _cached_model(cache_key, model_name)
+            if cached is not None:
+                return cached
+        
+        model, processor = _load_clip_model_uncached(model_name, device)
+        
+        with _MODEL_CACHE_LOCK:
+            _MODEL_CACHE[cache_key] = (model, processor)
+            _MODEL_LOAD_LOCKS.pop(cache_key, None)
+            while len(_MODEL_CACHE) > max(1, settings.CLIP_MODEL_CACHE_SIZE):
+                _evict_oldest_model()
+    
+    return model, processor
+
+
+def _cached_model(cache_key: str, model_name: str) -> Optional[Tuple[CLIPModel, CLIPProcessor]]:
+    """Look up a cached model and mark it most recently used. Call with _MODEL_CACHE_LOCK held."""
+    cached = _MODEL_CACHE.get(cache_key)
+    if cached is not None:
         logger.info(f"Using cached CLIP model: {model_name}")
-        return _MODEL_CACHE[cache_key]
+        _MODEL_CACHE.move_to_end(cache_key)
+    return cached
+
+
+def _evict_oldest_model() -> None:
+    """Drop the least recently used model and release its GPU memory. Call with _MODEL_CACHE_LOCK held."""
+    evicted_key, (evicted_model, evicted_processor) = _MODEL_CACHE.popitem(last=False)
+    logger.info(f"Evicting cached CLIP model: {evicted_key}")
+    for transform_key in [key for key in _TRANSFORM_CACHE if key[0] == id(evicted_processor)]:
+        del _TRANSFORM_CACHE[transform_key]
+    # Drop its text embeddings too, so a later model reusing the id can't hit them
+    with _TEXT_EMBEDDING_CACHE_LOCK:
+        for text_key in [key for key in _TEXT_EMBEDDING_CACHE if key[0] == id(evicted_model)]:
+            del _TEXT_EMBEDDING_CACHE[text_key]
+    on_cuda = evicted_model.device.type == "cuda"
+    del evicted_model, evicted_processor
+    if on_cuda:
+        torch.cuda.empty_cache()
+
+
+def _load_clip_model_uncached(model_name: str, device: str) -> Tuple[CLIPModel, CLIPProcessor]:
+    """
+    Load (and optionally compile and warm up) a CLIP model and processor.
     
+    Args:
+        model_name: Name of the CLIP model to load
+        device: Device to load model on ('cuda' or 'cpu')
+        
+    Returns:
+        Tuple of (model, processor)
+    """
     logger.info(f"Loading CLIP model: {model_name}")
-    model = CLIPModel.from_pretrained(model_name).to(device)
+    if device == "cuda":
+        _configure_cuda_backends()
+    # FP16 on CUDA halves memory traffic and runs matmuls on tensor cores; embeddings are upcast afterwards.
+    # Loading straight into the target dtype avoids materializing an FP32 copy first.
+    torch_dtype = torch.float16 if device == "cuda" else torch.float32
+    model = CLIPModel.from_pretrained(model_name, torch_dtype=torch_dtype).to(device).eval()
+    # model.device/model.dtype walk the parameters on every access; resolve them once
+    model._cached_device = model.device
+    model._cached_dtype = model.dtype
     processor = CLIPProcessor.from_pretrained(model_name)
-    
-    # Cache the loaded model
-    _MODEL_CACHE[cache_key] = (model, processor)
+    # Build the torch preprocessing constants up front instead of on the first frame batch
+    _image_transform(processor, model._cached_device)
+    if settings.CLIP_COMPILE:
+        # Compile the towers rather than the whole CLIPModel, whose output dicts trip up dynamo
+        logger.info("Compiling CLIP vision and text encoders with torch.compile")
+        model.vision_model = torch.compile(model.vision_model, mode="reduce-overhead", fullgraph=False)
+        model.text_model = torch.compile(model.text_model, mode="reduce-overhead", fullgraph=False)
+        _warm_up_clip_model(model, processor)
+    if device == "cuda" and settings.CLIP_CUDA_GRAPH:
+        _capture_image_graph(model)
     
     return model, processor
 
 
+def _capture_image_graph(model: CLIPModel) -> None:
+    """
+    Attach a CUDA Graph pool for BATCH_SIZE image batches to the model, if it can be captured.
+    
+    Args:
+        model: CLIP model on a CUDA device
+    """
+    if settings.CLIP_COMPILE:
+        # reduce-overhead compilation already replays CUDA Graphs; capturing it again is not supported
+        logger.warning("CLIP_CUDA_GRAPH is ignored when CLIP_COMPILE is enabled")
+        return
+    device, dtype = _model_device_dtype(model)
+    try:
+        model._image_graph = CUDAGraphImageEncoder(model, device, dtype, settings.BATCH_SIZE,
+                                                   settings.CLIP_CUDA_GRAPH_STREAMS)
+    except Exception as e:
+        logger.warning(f"Could not capture CLIP image encoder CUDA graph, using eager execution: {e}")
+
+
+def _configure_cuda_backends() -> None:
+    """Enable TF32 matmuls/convolutions and cuDNN autotuning (process-wide, idempotent)."""
+    # TF32 on Ampere+ for any FP32 work (CPU-loaded models moved to GPU, upcast features)
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    # The ViT patch-embedding conv sees the same input size every time, so the
+    # algorithm cuDNN picks on the first batch is reused from then on
+    torch.backends.cudnn.benchmark = True
+
+
+def _warm_up_clip_model(model: CLIPModel, processor: CLIPProcessor) -> None:
+    """
+    Run one dummy image and text through the model so compilation happens at load time.
+    
+    Args:
+        model: CLIP model with compiled towers
+        processor: CLIP processor
+    """
+    device, dtype = _model_device_dtype(model)
+    image_size = model.config.vision_config.image_size
+    pixel_values = torch.zeros(1, 3, image_size, image_size, device=device, dtype=dtype)
+    text_inputs = processor(text=["a photo"], return_tensors="pt", padding=True)
+    text_inputs = {key: _to_device(value, device) for key, value in text_inputs.items()}
+    with torch.inference_mode():
+        model.get_image_features(pixel_values=pixel_values)
+        model.get_text_features(**text_inputs)
+    logger.info("CLIP warm-up complete")
+
+
 def generate_image_embedding(
     image: np.ndarray,
     model: CLIPModel,
     processor: CLIPProcessor,
-) -> np.ndarray:
+    return_tensor: bool = False,
+) -> Union[np.ndarray, torch.Tensor]:
     """
     Generate CLIP embedding for an image.
     
@@ -51,44 +197,226 @@ def generate_image_embedding(
         image: Image as numpy array (BGR format from OpenCV)
         model: CLIP model
         processor: CLIP processor
+        return_tensor: Return the normalized float32 tensor on the model's device instead of numpy
         
     Returns:
-        Embedding as numpy array
+        Embedding as numpy array (or torch tensor if return_tensor)
     """
-    # Get the actual device model is on
-    model_device = next(model.parameters()).device
+    return generate_image_embeddings_batch([image], model, processor, return_tensor=return_tensor)[0]
+
+
+def _model_device_dtype(model: Union[CLIPModel, Any]) -> Tuple[torch.device, torch.dtype]:
+    """
+    Device and dtype of a model, using the values cached by load_clip_model when present.
     
-    # Convert BGR to RGB
-    image_rgb = image[..., ::-1]
+    Args:
+        model: CLIP model, or a TRTImageEncoder (which has plain device/dtype attributes)
+        
+    Returns:
+        Tuple of (device, dtype)
+    """
+    device = getattr(model, "_cached_device", None)
+    if device is None:
+        return model.device, model.dtype
+    return device, model._cached_dtype
+
+
+def _pinned_buffer(shape: Tuple[int, ...], dtype: torch.dtype) -> Optional[Tuple[torch.Tensor, "torch.cuda.Event"]]:
+    """
+    Get this thread's pinned staging buffer for a shape/dtype, waiting until its last upload is done.
     
-    # Prepare image for CLIP
-    inputs = processor(
-        images=image_rgb,
-        return_tensors="pt",
-        padding=True
-    )
+    Returns:
+        (buffer, upload event), or None when the size is outside the range worth staging
+    """
+    nbytes = int(np.prod(shape)) * torch.empty((), dtype=dtype).element_size()
+    if not _PIN_MIN_BYTES <= nbytes <= _PIN_MAX_BYTES:
+        return None
+    entry = getattr(_PINNED_STAGING, "entry", None)
+    if entry is None or tuple(entry[0].shape) != tuple(shape) or entry[0].dtype != dtype:
+        if entry is not None:
+            # Frees the old buffer only once its last copy has finished
+            entry[1].synchronize()
+        entry = _PINNED_STAGING.entry = (torch.empty(shape, dtype=dtype, pin_memory=True), torch.cuda.Event())
+    # The previous non-blocking copy out of this buffer must finish before it is overwritten
+    entry[1].synchronize()
+    return entry
+
+
+def _upload_staged(staging: torch.Tensor, uploaded: "torch.cuda.Event",
+                   device: torch.device, dtype: Optional[torch.dtype] = None) -> torch.Tensor:
+    """Start a non-blocking copy of a filled staging buffer and mark the buffer busy until it is done."""
+    result = staging.to(device, dtype=dtype, non_blocking=True)
+    uploaded.record()
+    return result
+
+
+def _to_device(tensor: torch.Tensor, device: torch.device, dtype: Optional[torch.dtype] = None) -> torch.Tensor:
+    """
+    Copy a CPU tensor to the device.
+    
+    Large CUDA copies are staged through a reused pinned buffer so the DMA runs
+    asynchronously; small tensors are copied directly.
+    
+    Args:
+        tensor: CPU tensor
+        device: Target device
+        dtype: Optional dtype to cast to on the device
+        
+    Returns:
+        Tensor on the device
+    """
+    entry = _pinned_buffer(tensor.shape, tensor.dtype) if device.type == "cuda" else None
+    if entry is None:
+        return tensor.to(device, dtype=dtype)
+    staging, uploaded = entry
+    staging.copy_(tensor)
+    return _upload_staged(staging, uploaded, device, dtype)
+
+
+def _stack_to_device(images: List[np.ndarray], device: torch.device) -> torch.Tensor:
+    """
+    Stack same-sized images into one batch on the device.
     
-    # Move inputs to the same device as the model
-    for key in inputs:
-        if torch.is_tensor(inputs[key]):
-            inputs[key] = inputs[key].to(model_device)
+    On CUDA the batch is stacked straight into the pinned staging buffer,
+    so there is no intermediate host copy.
     
-    # Generate embedding
-    with torch.no_grad():
-        image_features = model.get_image_features(**inputs)
+    Args:
+        images: Same-sized numpy arrays
+        device: Target device
+        
+    Returns:
+        (len(images), *image.shape) tensor on the device
+    """
+    shape = (len(images), *images[0].shape)
+    entry = None
+    if device.type == "cuda":
+        entry = _pinned_buffer(shape, torch.from_numpy(np.empty(0, dtype=images[0].dtype)).dtype)
+    if entry is None:
+        return torch.from_numpy(np.stack(images)).to(device)
+    staging, uploaded = entry
+    np.stack(images, out=staging.numpy())
+    return _upload_staged(staging, uploaded, device)
+
+
+def _image_transform(processor: CLIPProcessor, device: torch.device) -> Tuple[int, int, int, torch.Tensor, torch.Tensor]:
+    """
+    Get the CLIP image processor's resize/crop sizes and mean/std tensors on a device.
+    
+    Args:
+        processor: CLIP processor
+        device: Device the mean/std tensors should live on
+        
+    Returns:
+        Tuple of (shortest_edge, crop_height, crop_width, mean, std); mean/std have shape (1, 3, 1, 1)
+    """
+    cache_key = (id(processor), str(device))
+    transform = _TRANSFORM_CACHE.get(cache_key)
+    if transform is None:
+        image_processor = processor.image_processor
+        transform = (
+            image_processor.size["shortest_edge"],
+            image_processor.crop_size["height"],
+            image_processor.crop_size["width"],
+            torch.tensor(image_processor.image_mean, device=device).view(1, 3, 1, 1),
+            torch.tensor(image_processor.image_std, device=device).view(1, 3, 1, 1),
+        )
+        _TRANSFORM_CACHE[cache_key] = transform
+    return transform
+
+
+def preprocess_images_torch(
+    images: List[np.ndarray],
+    processor: CLIPProcessor,
+    device: torch.device,
+    dtype: torch.dtype,
+) -> torch.Tensor:
+    """
+    CLIP image preprocessing in torch, on the model's device, without the PIL round-trip.
+    
+    Mirrors the CLIP image processor: resize the shortest edge (bicubic, antialiased),
+    center crop, scale to [0, 1] and normalize with the processor's mean/std.
+    
+    Args:
+        images: Same-sized images as numpy arrays (BGR format from OpenCV)
+        processor: CLIP processor (source of size, crop size, mean and std)
+        device: Device to preprocess on
+        dtype: dtype of the returned pixel values
+        
+    Returns:
+        pixel_values tensor of shape (len(images), 3, crop_height, crop_width)
+    """
+    shortest_edge, crop_height, crop_width, mean, std = _image_transform(processor, device)
+    
+    # One upload of the uint8 batch; BGR -> RGB and BHWC -> BCHW on the device
+    batch = _stack_to_device(images, device)
+    batch = batch.flip(-1).permute(0, 3, 1, 2).float()
+    
+    height, width = batch.shape[-2:]
+    scale = shortest_edge / min(height, width)
+    resized_height, resized_width = max(crop_height, round(height * scale)), max(crop_width, round(width * scale))
+    batch = F.interpolate(batch, size=(resized_height, resized_width), mode="bicubic", align_corners=False, antialias=True)
+    
+    top = (resized_height - crop_height) // 2
+    left = (resized_width - crop_width) // 2
+    batch = batch[:, :, top:top + crop_height, left:left + crop_width]
+    
+    batch = batch.clamp_(0, 255).div_(255.0).sub_(mean).div_(std)
+    return batch.to(dtype)
+
+
+def generate_image_embeddings_batch(
+    images: List[np.ndarray],
+    model: CLIPModel,
+    processor: CLIPProcessor,
+    return_tensor: bool = False,
+) -> Union[np.ndarray, torch.Tensor]:
+    """
+    Generate CLIP embeddings for several images in a single forward pass.
+    
+    Args:
+        images: Images as numpy arrays (BGR format from OpenCV)
+        model: CLIP model, or a TRTImageEncoder
+        processor: CLIP processor
+        return_tensor: Keep the result on the model's device as a torch tensor (no device-to-host sync)
         
-    # Normalize and convert to numpy
-    embedding = image_features.cpu().numpy()[0]
-    embedding = embedding / np.linalg.norm(embedding)
+    Returns:
+        Embeddings as a (len(images), dim) float32 numpy array (or tensor), one normalized row per image
+    """
+    model_device, model_dtype = _model_device_dtype(model)
+    
+    if all(image.shape == images[0].shape for image in images):
+        # Frames of one video share a size: resize/crop/normalize the whole batch in torch
+        pixel_values = preprocess_images_torch(images, processor, model_device, model_dtype)
+    else:
+        # Mixed sizes cannot be stacked; convert BGR to RGB (contiguous, so the processor
+        # doesn't copy a negative-stride view again) and use the HF processor
+        inputs = processor(
+            images=[np.ascontiguousarray(image[:, :, ::-1]) for image in images],
+            return_tensors="pt"
+        )
+        pixel_values = _to_device(inputs["pixel_values"], model_device, model_dtype)
+    
+    # Batches up to the captured size replay the CUDA graph instead of dispatching op by op
+    image_graph = getattr(model, "_image_graph", None)
+    if image_graph is not None and image_graph.accepts(pixel_values):
+        model = image_graph
+    
+    # One forward pass for the whole batch
+    with torch.inference_mode():
+        image_features = model.get_image_features(pixel_values=pixel_values)
+        image_features = F.normalize(image_features.float(), dim=-1)
     
-    return embedding
+    if return_tensor:
+        return image_features
+    return image_features.cpu().numpy()
 
 
 def generate_text_embedding(
     text: str,
     model: CLIPModel,
     processor: CLIPProcessor,
-) -> np.ndarray:
+    return_tensor: bool = False,
+) -> Union[np.ndarray, torch.Tensor]:
     """
     Generate CLIP embedding for text.
     
@@ -96,31 +424,99 @@ def generate_text_embedding(
         text: Text to embed
         model: CLIP model
         processor: CLIP processor
+        return_tensor: Return the normalized float32 tensor on the model's device instead of numpy
+            (bypasses the text-embedding cache, which holds numpy rows)
         
     Returns:
-        Embedding as numpy array
+        Embedding as numpy array (or torch tensor if return_tensor)
+    """
+    if return_tensor:
+        return generate_text_embeddings_batch([text], model, processor, return_tensor=True)[0]
+    return generate_text_embeddings_cached([text], model, processor)[0]
+
+
+def generate_text_embeddings_cached(
+    texts: List[str],
+    model: CLIPModel,
+    processor: CLIPProcessor,
+) -> np.ndarray:
     """
-    # Get the actual device model is on
-    model_device = next(model.parameters()).device
+    Generate CLIP embeddings for several texts, running the model only for texts not in the LRU cache.
     
-    # Prepare text for CLIP
+    Args:
+        texts: Texts to embed
+        model: CLIP model
+        processor: CLIP processor
+        
+    Returns:
+        Embeddings as a (len(texts), dim) float32 numpy array, one normalized row per text
+    """
+    model_key = id(model)
+    embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+    misses = []
+    with _TEXT_EMBEDDING_CACHE_LOCK:
+        for i, text in enumerate(texts):
+            cached = _TEXT_EMBEDDING_CACHE.get((model_key, text))
+            if cached is None:
+                misses.append(i)
+            else:
+                _TEXT_EMBEDDING_CACHE.move_to_end((model_key, text))
+                embeddings[i] = cached
+    
+    if misses:
+        # Encode each distinct missing text once
+        miss_texts = list(dict.fromkeys(texts[i] for i in misses))
+        by_text = dict(zip(miss_texts, generate_text_embeddings_batch(miss_texts, model, processor)))
+        for i in misses:
+            embeddings[i] = by_text[texts[i]]
+        
+        if settings.TEXT_EMBEDDING_CACHE_SIZE > 0:
+            with _TEXT_EMBEDDING_CACHE_LOCK:
+                for text, embedding in by_text.items():
+                    embedding.setflags(write=False) # Shared across callers
+                    _TEXT_EMBEDDING_CACHE[(model_key, text)] = embedding
+                while len(_TEXT_EMBEDDING_CACHE) > settings.TEXT_EMBEDDING_CACHE_SIZE:
+                    _TEXT_EMBEDDING_CACHE.popitem(last=False)
+    
+    return np.stack(embeddings)
+
+
+def generate_text_embeddings_batch(
+    texts: List[str],
+    model: CLIPModel,
+    processor: CLIPProcessor,
+    return_tensor: bool = False,
+) -> Union[np.ndarray, torch.Tensor]:
+    """
+    Generate CLIP embeddings for several texts in a single forward pass.
+    
+    Args:
+        texts: Texts to embed
+        model: CLIP model
+        processor: CLIP processor
+        return_tensor: Keep the result on the model's device as a torch tensor (no device-to-host sync)
+        
+    Returns:
+        Embeddings as a (len(texts), dim) float32 numpy array (or tensor), one normalized row per text
+    """
+    model_device, _ = _model_device_dtype(model)
+    
+    # Prepare text for CLIP (padding aligns the batch to the longest query)
     inputs = processor(
-        text=[text],
+        text=texts,
         return_tensors="pt",
         padding=True
     )
     
-    # Move inputs to the same device as the model
-    for key in inputs:
-        if torch.is_tensor(inputs[key]):
-            inputs[key] = inputs[key].to(model_device)
+    # Move the token tensors to the model's device in one pass
+    inputs = {key: _to_device(value, model_device) for key, value in inputs.items()}
     
-    # Generate embedding
-    with torch.no_grad():
+    # Generate embeddings and normalize each row on the device (upcast from fp16 on CUDA)
+    with torch.inference_mode():
         text_features = model.get_text_features(**inputs)
-        
-    # Normalize and convert to numpy
-    embedding = text_features.cpu().numpy()[0]
-    embedding = embedding / np.linalg.norm(embedding)
+        text_features = F.normalize(text_features.float(), dim=-1)
     
-    return embedding 
\ No newline at end of file
+    if return_tensor:
+        return text_features
+    # Single device-to-host transfer of the normalized matrix
+    return text_features.cpu().numpy()
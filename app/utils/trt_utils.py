@@ -0,0 +1,108 @@
+"""TensorRT inference for the CLIP image encoder.
+
+TensorRT is optional: engines are built offline with scripts/export_clip_trt.py
+and only loaded when USE_TRT is enabled and the engine file exists.
+"""
+
+import logging
+from pathlib import Path
+from typing import Optional, Union
+
+import torch
+
+try:
+    import tensorrt as trt
+    TRT_AVAILABLE = True
+except ImportError:
+    TRT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Tensor names used by scripts/export_clip_trt.py
+INPUT_NAME = "pixel_values"
+OUTPUT_NAME = "image_embeds"
+
+if TRT_AVAILABLE:
+    _TRT_TO_TORCH_DTYPE = {
+        trt.DataType.FLOAT: torch.float32,
+        trt.DataType.HALF: torch.float16,
+    }
+
+
+class TRTImageEncoder:
+    """
+    Drop-in replacement for CLIPModel.get_image_features backed by a TensorRT engine.
+
+    Exposes the attributes the embedding helpers use (device, dtype and
+    get_image_features), so it can be passed wherever a CLIP model is used
+    for image embeddings.
+    """
+
+    def __init__(self, engine_path: Union[str, Path], device: str = "cuda"):
+        """
+        Deserialize an engine built from the exported CLIP image tower.
+
+        Args:
+            engine_path: Path to the serialized TensorRT engine (.plan)
+            device: CUDA device to run on
+        """
+        self.device = torch.device(device)
+        self._trt_logger = trt.Logger(trt.Logger.WARNING)
+        runtime = trt.Runtime(self._trt_logger)
+        self.engine = runtime.deserialize_cuda_engine(Path(engine_path).read_bytes())
+        if self.engine is None:
+            raise RuntimeError(f"Failed to deserialize TensorRT engine: {engine_path}")
+        self.context = self.engine.create_execution_context()
+        # Inputs are cast to the dtype the engine was built for (fp32 I/O even with --fp16 kernels)
+        self.dtype = _TRT_TO_TORCH_DTYPE[self.engine.get_tensor_dtype(INPUT_NAME)]
+        self._output_dtype = _TRT_TO_TORCH_DTYPE[self.engine.get_tensor_dtype(OUTPUT_NAME)]
+        self.embedding_dim = self.engine.get_tensor_shape(OUTPUT_NAME)[-1]
+
+    def get_image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Run the engine on a batch of preprocessed images.
+
+        Args:
+            pixel_values: (batch, 3, height, width) tensor on the engine's device
+
+        Returns:
+            (batch, dim) projected image embeddings (not normalized)
+        """
+        pixel_values = pixel_values.to(self.device, dtype=self.dtype).contiguous()
+        output = torch.empty((pixel_values.shape[0], self.embedding_dim), dtype=self._output_dtype, device=self.device)
+        self.context.set_input_shape(INPUT_NAME, tuple(pixel_values.shape))
+        self.context.set_tensor_address(INPUT_NAME, pixel_values.data_ptr())
+        self.context.set_tensor_address(OUTPUT_NAME, output.data_ptr())
+        stream = torch.cuda.current_stream(self.device)
+        if not self.context.execute_async_v3(stream.cuda_stream):
+            raise RuntimeError("TensorRT inference failed")
+        return output
+
+
+def load_trt_image_encoder(engine_path: Union[str, Path], device: str) -> Optional[TRTImageEncoder]:
+    """
+    Load the TensorRT image encoder if possible.
+
+    Args:
+        engine_path: Path to the serialized TensorRT engine
+        device: Device the CLIP model runs on
+
+    Returns:
+        The encoder, or None (after logging why) if PyTorch CLIP should be used instead
+    """
+    if device != "cuda":
+        logger.warning("USE_TRT is set but CLIP runs on CPU; using the PyTorch image encoder")
+        return None
+    if not TRT_AVAILABLE:
+        logger.warning("USE_TRT is set but TensorRT is not installed; using the PyTorch image encoder")
+        return None
+    if not Path(engine_path).is_file():
+        logger.warning(f"TensorRT engine not found at {engine_path}; using the PyTorch image encoder")
+        return None
+    try:
+        encoder = TRTImageEncoder(engine_path, device)
+    except Exception as e:
+        logger.warning(f"Could not load TensorRT engine {engine_path}, using the PyTorch image encoder: {e}")
+        return None
+    logger.info(f"Using TensorRT image encoder from {engine_path}")
+    return encoder
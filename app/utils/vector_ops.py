@@ -0,0 +1,95 @@
+"""Vector math kernels for the embedding hot paths.
+
+Numba is optional: when it is installed the kernels are JIT-compiled,
+otherwise equivalent NumPy implementations are used.
+"""
+
+import numpy as np
+from typing import Optional
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Bits set in each byte value, for popcount on NumPy < 2.0 (no np.bitwise_count)
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _normalize_rows_numba(buf, start, stop):
+        dim = buf.shape[1]
+        for i in prange(start, stop):
+            s = 0.0
+            for j in range(dim):
+                s += buf[i, j] * buf[i, j]
+            if s > 0.0:
+                inv = 1.0 / np.sqrt(s)
+                for j in range(dim):
+                    buf[i, j] *= inv
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _dot_window_numba(query, window):
+        out = np.empty(window.shape[0], dtype=np.float32)
+        for i in prange(window.shape[0]):
+            s = np.float32(0.0)
+            for j in range(query.shape[0]):
+                s += window[i, j] * query[j]
+            out[i] = s
+        return out
+
+
+def normalize_rows_(buf: np.ndarray, start: int = 0, stop: Optional[int] = None) -> None:
+    """
+    L2-normalize rows [start, stop) of a 2-D float32 array in place.
+    
+    Args:
+        buf: C-contiguous float32 matrix
+        start: First row to normalize
+        stop: One past the last row to normalize (defaults to all rows)
+    """
+    if stop is None:
+        stop = buf.shape[0]
+    if NUMBA_AVAILABLE:
+        _normalize_rows_numba(buf, start, stop)
+        return
+    rows = buf[start:stop]
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    np.divide(rows, norms, out=rows, where=norms > 0)
+
+
+def dot_window(query: np.ndarray, window: np.ndarray) -> np.ndarray:
+    """
+    Dot product of a query vector against every row of a small matrix.
+    
+    Args:
+        query: (dim,) vector
+        window: (n, dim) matrix, e.g. the recent-frame embeddings
+        
+    Returns:
+        (n,) float32 array of similarities
+    """
+    query = np.ascontiguousarray(query, dtype=np.float32)
+    window = np.ascontiguousarray(window, dtype=np.float32)
+    if NUMBA_AVAILABLE:
+        return _dot_window_numba(query, window)
+    return window @ query
+
+
+def hamming_distances(hashes: np.ndarray, query: np.uint64) -> np.ndarray:
+    """
+    Hamming distance between a 64-bit hash and every entry of a hash array.
+    
+    Args:
+        hashes: (n,) uint64 array of packed hashes
+        query: Hash to compare against
+        
+    Returns:
+        (n,) array of differing bit counts
+    """
+    xor = hashes ^ np.uint64(query)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return _POPCOUNT_LUT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
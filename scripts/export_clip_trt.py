@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Export the CLIP image encoder to ONNX and build a TensorRT engine from it.
+
+The engine is used for video processing when USE_TRT=True (see TRT_ENGINE_PATH).
+
+Usage:
+    python -m scripts.export_clip_trt
+    python -m scripts.export_clip_trt --onnx-only   # build the engine yourself with trtexec
+"""
+
+import argparse
+import logging
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import torch
+
+from app.core.config import settings
+from app.utils.trt_utils import INPUT_NAME, OUTPUT_NAME
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class _ImageTower(torch.nn.Module):
+    """CLIP vision transformer plus projection, i.e. CLIPModel.get_image_features."""
+
+    def __init__(self, clip_model):
+        super().__init__()
+        self.clip_model = clip_model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.clip_model.get_image_features(pixel_values=pixel_values)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export the CLIP image encoder to ONNX/TensorRT')
+    parser.add_argument('--onnx-path', type=str, default=str(settings.TRT_ENGINE_PATH.with_suffix('.onnx')),
+                        help='Where to write the ONNX model')
+    parser.add_argument('--engine-path', type=str, default=str(settings.TRT_ENGINE_PATH),
+                        help=f'Where to write the TensorRT engine (default: {settings.TRT_ENGINE_PATH})')
+    parser.add_argument('--opt-batch', type=int, default=settings.BATCH_SIZE,
+                        help='Batch size the engine is tuned for (default: BATCH_SIZE)')
+    parser.add_argument('--max-batch', type=int, default=2 * settings.BATCH_SIZE,
+                        help='Largest batch size the engine accepts')
+    parser.add_argument('--onnx-only', action='store_true',
+                        help='Only export ONNX and print the trtexec command')
+    return parser.parse_args()
+
+
+def export_onnx(onnx_path: Path, opset: int = 17) -> int:
+    """Export the image tower to ONNX with a dynamic batch axis; returns the input image size."""
+    # Imported here so --help works without loading transformers
+    from transformers import CLIPModel
+
+    logger.info(f"Loading CLIP model: {settings.CLIP_MODEL_NAME}")
+    clip_model = CLIPModel.from_pretrained(settings.CLIP_MODEL_NAME).eval()
+    image_size = clip_model.config.vision_config.image_size
+    dummy = torch.zeros(1, 3, image_size, image_size)
+
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Exporting ONNX model to {onnx_path}")
+    with torch.inference_mode():
+        torch.onnx.export(
+            _ImageTower(clip_model),
+            (dummy,),
+            str(onnx_path),
+            input_names=[INPUT_NAME],
+            output_names=[OUTPUT_NAME],
+            dynamic_axes={INPUT_NAME: {0: 'batch'}, OUTPUT_NAME: {0: 'batch'}},
+            opset_version=opset,
+        )
+    return image_size
+
+
+def main() -> int:
+    args = parse_args()
+    onnx_path = Path(args.onnx_path)
+    engine_path = Path(args.engine_path)
+
+    image_size = export_onnx(onnx_path)
+    shape = f"3x{image_size}x{image_size}"
+    command = [
+        'trtexec',
+        f'--onnx={onnx_path}',
+        '--fp16',
+        f'--minShapes={INPUT_NAME}:1x{shape}',
+        f'--optShapes={INPUT_NAME}:{args.opt_batch}x{shape}',
+        f'--maxShapes={INPUT_NAME}:{args.max_batch}x{shape}',
+        f'--saveEngine={engine_path}',
+    ]
+
+    if args.onnx_only or shutil.which('trtexec') is None:
+        if not args.onnx_only:
+            logger.warning("trtexec not found on PATH; build the engine manually")
+        print(' '.join(command))
+        return 0
+
+    logger.info(f"Building TensorRT engine: {' '.join(command)}")
+    result = subprocess.run(command)
+    if result.returncode != 0:
+        logger.error("trtexec failed")
+        return result.returncode
+    logger.info(f"TensorRT engine written to {engine_path}; set USE_TRT=True to use it")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,22 +4,29 @@ CLI script to search video frames using the search service.
 
 Usage:
     python -m scripts.search_frames --query "person walking" --top 4
+    python -m scripts.search_frames --queries-file queries.txt --format json --output results.json
 """
 
 import sys
 import argparse
-import json
+import asyncio
+import functools
+import orjson
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import TYPE_CHECKING, Dict, List, Any, Optional
 
 # Add parent directory to path using pathlib
 project_root = str(Path(__file__).parent.parent)
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from app.services.video.frame_processor import FrameProcessor
-from app.core.config import FRAMES_DIR
+# app.* pulls in torch, transformers and FAISS; those imports are deferred until a
+# search actually runs so --help and argument errors return immediately
+if TYPE_CHECKING:
+    from app.services.search.faiss_service import FAISSService
 
 # Set up logging
 logging.basicConfig(
@@ -28,17 +35,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Built on first search and reused for every later query in this process
+_FAISS_SERVICE: Optional["FAISSService"] = None
+
+
+def _get_faiss_service() -> "FAISSService":
+    """Load CLIP and the FAISS index (memory-mapped when FAISS_MMAP_INDEX is set) once per process."""
+    global _FAISS_SERVICE
+    if _FAISS_SERVICE is None:
+        from app.core.config import settings
+        from app.services.search.faiss_service import FAISSService
+        
+        _FAISS_SERVICE = FAISSService(
+            index_dir=settings.FAISS_INDEX_DIR,
+            clip_model_name=settings.CLIP_MODEL_NAME,
+            clip_device=settings.CLIP_DEVICE
+        )
+    return _FAISS_SERVICE
+
+
+@functools.lru_cache(maxsize=1)
+def _frames_dir_str() -> str:
+    """FRAMES_DIR as a plain string, so result paths are joined without building Path objects per result."""
+    from app.core.config import settings
+    return os.fspath(settings.FRAMES_DIR)
+
 
 def _format_results_for_json(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Helper function to format search results for JSON output."""
+    frames_dir = _frames_dir_str()
     json_results = []
     for result in results:
-        metadata = result.get('metadata', {})
         json_result = {
-            'clip_score': float(result.get('clip_score', 0.0)),
-            'video_name': Path(metadata.get('video_path', '')).name,
-            'timestamp': float(metadata.get('timestamp', 0.0)),
-            'frame_path': str(Path(FRAMES_DIR) / metadata.get('frame_path', ''))
+            'clip_score': float(result.get('similarity', 0.0)),
+            'video_name': result.get('video_name', ''),
+            'timestamp': float(result.get('timestamp', 0.0)),
+            'frame_path': os.path.join(frames_dir, result.get('frame_path', ''))
         }
         json_results.append(json_result)
     return json_results
@@ -47,6 +79,8 @@ def search_frames(query: str, top_k: int = 4, output_format: str = 'text') -> Li
     """
     Search for frames using the search service.
     
+    Text output is printed here; JSON output is formatted once by the caller.
+    
     Args:
         query: Text query
         top_k: Number of results to return
@@ -55,48 +89,85 @@ def search_frames(query: str, top_k: int = 4, output_format: str = 'text') -> Li
     Returns:
         List of raw result dictionaries from the service
     """
-    # Initialize the frame processor
-    frame_processor = FrameProcessor()
-    
-    # Search for frames
+    # Search the FAISS index directly; raw results carry the frame metadata the CLI prints
+    faiss_service = _get_faiss_service()
     logger.info(f"Searching for: {query}")
-    results = frame_processor.search_frames(query, top_k=top_k)
+    results = faiss_service.search(query, top_k=top_k)["results"]
+    
+    if output_format in ('text', 'both'):
+        _print_results(query, results)
+            
+    return results
+
+async def search_frames_async(queries: List[str], top_k: int = 4, max_concurrency: int = 4) -> List[List[Dict[str, Any]]]:
+    """
+    Search for many queries, overlapping tokenization and host work of one chunk with the forward pass of another.
+    
+    Queries are split into chunks of SEARCH_BATCH_MAX_SIZE; each chunk is one batched CLIP
+    forward pass and FAISS search, run on a worker thread.
     
+    Args:
+        queries: Text queries
+        top_k: Number of results to return per query
+        max_concurrency: Chunks in flight at once
+        
+    Returns:
+        One list of raw result dictionaries per query, in input order
+    """
+    from app.core.config import settings
+    
+    faiss_service = _get_faiss_service()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    chunk_size = max(1, settings.SEARCH_BATCH_MAX_SIZE)
+    chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+    logger.info(f"Searching for {len(queries)} queries in {len(chunks)} batches")
+    
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        async def search_chunk(chunk: List[str]) -> List[Dict[str, List[Dict[str, Any]]]]:
+            async with semaphore:
+                return await loop.run_in_executor(executor, faiss_service.search_batch, chunk, top_k)
+        
+        responses = await asyncio.gather(*(search_chunk(chunk) for chunk in chunks))
+    
+    return [response["results"] for chunk_responses in responses for response in chunk_responses]
+
+def _print_results(query: str, results: List[Dict[str, Any]]) -> None:
+    """Print one query's results in text format."""
     if not results:
-        print("No results found.")
-        return []
+        print(f"No results found for query: '{query}'")
+        return
+    
+    print(f"\nTop {len(results)} results for query: '{query}'")
+    print("-" * 60)
+    
+    frames_dir = _frames_dir_str()
+    
+    for i, result in enumerate(results):
+        score = result.get('similarity', 0.0)
+        video_name = result.get('video_name', 'N/A')
+        timestamp = result.get('timestamp', 0.0)
+        frame_rel_path = result.get('frame_path', 'N/A')
+        frame_abs_path = os.path.join(frames_dir, frame_rel_path)
         
-    if output_format in ('text', 'both'):
-        # Print results in text format
-        print(f"\nTop {len(results)} results for query: '{query}'")
+        print(f"{i+1}. Score: {score:.4f}")
+        print(f"   Video: {video_name} | Time: {timestamp:.2f}s")
+        print(f"   Frame: {frame_abs_path}") # Show absolute path for clarity in script
         print("-" * 60)
-        
-        for i, result in enumerate(results):
-            metadata = result.get('metadata', {})
-            score = result.get('clip_score', 0.0)
-            video_path = metadata.get('video_path', 'N/A')
-            timestamp = metadata.get('timestamp', 0.0)
-            frame_rel_path = metadata.get('frame_path', 'N/A')
-            frame_abs_path = Path(FRAMES_DIR) / frame_rel_path
-            
-            print(f"{i+1}. Score: {score:.4f}")
-            print(f"   Video: {Path(video_path).name} | Time: {timestamp:.2f}s")
-            print(f"   Frame: {frame_abs_path}") # Show absolute path for clarity in script
-            print("-" * 60)
-    
-    if output_format in ('json', 'both'):
-        json_results = _format_results_for_json(results)
-        # Print JSON if format is 'json' or 'both' and no output file specified (handled in main)
-        if output_format == 'json':
-            print(json.dumps(json_results, indent=2))
-            
-    return results # Return the original results for potential file saving
+
+def _read_queries(path: str) -> List[str]:
+    """Read one query per line, skipping blank lines."""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
 
 def main() -> None:
     """Main entry point for the script."""
     parser = argparse.ArgumentParser(description='Search video frames')
-    parser.add_argument('--query', type=str, required=True,
-                        help='Text query to search for')
+    query_group = parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument('--query', type=str,
+                             help='Text query to search for')
+    query_group.add_argument('--queries-file', type=str,
+                             help='File with one text query per line, searched concurrently')
     parser.add_argument('--top', type=int, default=4,
                         help='Number of top results to return')
     parser.add_argument('--format', choices=['text', 'json', 'both'], default='text',
@@ -113,15 +184,41 @@ def main() -> None:
         logging.getLogger().setLevel(logging.DEBUG)
     
     # Search frames
-    results = search_frames(args.query, args.top, args.format)
+    if args.query is not None:
+        queries = [args.query]
+        all_results = [search_frames(args.query, args.top, args.format)]
+        json_results = _format_results_for_json(all_results[0])
+    else:
+        queries = _read_queries(args.queries_file)
+        all_results = asyncio.run(search_frames_async(queries, args.top)) if queries else []
+        if args.format in ('text', 'both'):
+            for query, results in zip(queries, all_results):
+                _print_results(query, results)
+        json_results = [
+            {'query': query, 'results': _format_results_for_json(results)}
+            for query, results in zip(queries, all_results)
+        ]
+    
+    if args.format not in ('json', 'both'):
+        return
+    
+    if args.format == 'json':
+        # stdout carries only JSON; an empty result is still printed so callers can tell it from a crash
+        for query, results in zip(queries, all_results):
+            if not results:
+                print(f"No results found for query: '{query}'", file=sys.stderr)
+    
+    # Format and serialize once for both printing and saving
+    json_bytes = orjson.dumps(json_results, option=orjson.OPT_INDENT_2)
+    
+    if args.format == 'json':
+        print(json_bytes.decode())
     
     # Optionally save to file
-    if args.output and args.format in ('json', 'both'):
-        if results: # Only save if there are results
-            json_results = _format_results_for_json(results)
+    if args.output:
+        if any(all_results): # Only save if there are results
             try:
-                with open(args.output, 'w') as f:
-                    json.dump(json_results, f, indent=2)
+                Path(args.output).write_bytes(json_bytes)
                 logger.info(f"Results saved to {args.output}")
             except IOError as e:
                 logger.error(f"Failed to write results to {args.output}: {e}")
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from app.utils.duplicate_detector import DuplicateDetector
+
+DIM = DuplicateDetector.EMBEDDING_DIM
+WINDOW = 10
+
+
+def _basis(*indices):
+    """Orthonormal embeddings: unrelated frames have similarity 0, repeats have 1."""
+    embeddings = np.zeros((len(indices), DIM), dtype=np.float32)
+    embeddings[np.arange(len(indices)), indices] = 1.0
+    return embeddings
+
+
+def _frames(n):
+    return [np.zeros((8, 8, 3), dtype=np.uint8)] * n
+
+
+def _hashes(start, n):
+    # Hash stage disabled (threshold 0); distinct values keep it out of the way regardless
+    return np.arange(start, start + n, dtype=np.uint64)
+
+
+@pytest.fixture
+def detector():
+    return DuplicateDetector(None, None, hash_threshold=0, window_size=WINDOW)
+
+
+def _is_dup(results):
+    return [is_dup for is_dup, _ in results]
+
+
+def test_batch_detects_duplicate_within_batch(detector):
+    results = detector.is_duplicate_batch(_frames(3), _basis(0, 1, 0), _hashes(1, 3))
+    assert _is_dup(results) == [False, False, True]
+    assert detector.frame_embeddings.shape[0] == 2
+
+
+def test_batch_detects_duplicate_pushed_out_of_ring_by_same_batch(detector):
+    # 8 unique frames: below the window size, so the next batch skips the ANN search
+    detector.is_duplicate_batch(_frames(8), _basis(*range(8)), _hashes(1, 8))
+
+    # 5 new frames push rows 0-2 out of the ring before the repeat of frame 0 is checked
+    embeddings = _basis(8, 9, 10, 11, 12, 0)
+    results = detector.is_duplicate_batch(_frames(6), embeddings, _hashes(100, 6))
+
+    assert _is_dup(results) == [False] * 5 + [True]
+    assert detector.frame_embeddings.shape[0] == 13
+
+
+def test_batch_uses_ann_search_beyond_window(detector):
+    detector.is_duplicate_batch(_frames(20), _basis(*range(20)), _hashes(1, 20))
+
+    results = detector.is_duplicate_batch(_frames(2), _basis(3, 40), _hashes(100, 2))
+
+    assert _is_dup(results) == [True, False]
+    assert detector.ann_index.ntotal == 21
+
+
+def test_accepted_embeddings_are_returned(detector):
+    embeddings = _basis(5, 6)
+    results = detector.is_duplicate_batch(_frames(2), embeddings, _hashes(1, 2))
+    for (is_dup, embedding), expected in zip(results, embeddings):
+        assert not is_dup
+        np.testing.assert_array_equal(embedding, expected)
+
+
+def test_is_duplicate_matches_batch_path(detector):
+    is_dup, embedding = detector.is_duplicate(np.zeros((8, 8, 3), dtype=np.uint8), _basis(1)[0])
+    assert not is_dup and embedding is not None
+    is_dup, embedding = detector.is_duplicate(np.full((8, 8, 3), 255, dtype=np.uint8), _basis(1)[0])
+    assert is_dup and embedding is None
+
+
+def test_clear_resets_state(detector):
+    detector.is_duplicate_batch(_frames(3), _basis(0, 1, 2), _hashes(1, 3))
+    detector.clear()
+    assert detector.frame_embeddings.shape[0] == 0
+    assert detector.ann_index.ntotal == 0
+    assert _is_dup(detector.is_duplicate_batch(_frames(1), _basis(0), _hashes(1, 1))) == [False]
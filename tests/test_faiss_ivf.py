@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("transformers")
+
+from app.services.search import faiss_service as faiss_service_module
+from app.services.search.faiss_service import FAISSService
+from app.services.search.metadata_store import FrameMetadataStore
+
+DIM = 32
+MIN_VECTORS = 200
+
+
+@pytest.fixture(autouse=True)
+def small_ivf_settings(monkeypatch):
+    test_settings = faiss_service_module.settings.model_copy(update={
+        "EMBEDDING_DIM": DIM,
+        "FAISS_STORAGE_DTYPE": "fp32",
+        "FAISS_IVF_FACTORY": "IVF4,Flat",
+        "FAISS_IVF_MIN_VECTORS": MIN_VECTORS,
+        "FAISS_NPROBE": 4,
+        "FAISS_MMAP_INDEX": False,
+    })
+    monkeypatch.setattr(faiss_service_module, "settings", test_settings)
+
+
+def _service(index_dir):
+    # CPU-only service without CLIP; only the index and metadata are exercised
+    service = FAISSService.__new__(FAISSService)
+    service.index_path = index_dir
+    service.embedding_dim = DIM
+    service.device = "cpu"
+    service._gpu_resources = None
+    service._on_gpu = False
+    service._index_read_only = False
+    service._is_ivf = False
+    service._lock = threading.RLock()
+    service._save_lock = threading.Lock()
+    service._save_executor = None
+    service._emb_buf = np.empty((0, DIM), dtype=np.float32)
+    service.index = service._initialize_index()
+    service.metadata = service._load_metadata()
+    return service
+
+
+def _store(service, start, n):
+    embeddings = np.random.default_rng(start).standard_normal((n, DIM)).astype(np.float32)
+    service.store_embeddings_soa(
+        embeddings,
+        [f"frame_{i}.jpg" for i in range(start, start + n)],
+        ["video.mp4"] * n,
+        [float(i) for i in range(start, start + n)],
+    )
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_small_corpus_stays_flat(tmp_path):
+    service = _service(tmp_path)
+    _store(service, 0, MIN_VECTORS - 1)
+    assert not service.maybe_convert_to_ivf()
+    assert faiss.try_extract_index_ivf(service.index) is None
+
+
+def test_store_does_not_convert(tmp_path):
+    service = _service(tmp_path)
+    _store(service, 0, MIN_VECTORS)
+    assert faiss.try_extract_index_ivf(service.index) is None
+
+
+def test_conversion_keeps_ids_and_runs_once(tmp_path):
+    service = _service(tmp_path)
+    vectors = _store(service, 0, MIN_VECTORS)
+
+    assert service.maybe_convert_to_ivf()
+    ivf_index = service.index
+    assert faiss.try_extract_index_ivf(ivf_index) is not None
+    assert ivf_index.ntotal == MIN_VECTORS
+
+    _, indices = service.index.search(vectors[:5], 1)
+    assert indices[:, 0].tolist() == list(range(5))
+
+    # Later stores append to the IVF index instead of converting again
+    _store(service, MIN_VECTORS, 10)
+    assert not service.maybe_convert_to_ivf()
+    assert service.index is ivf_index
+    assert service.index.ntotal == len(service.metadata) == MIN_VECTORS + 10
+
+
+def test_loaded_ivf_index_is_not_converted_again(tmp_path):
+    service = _service(tmp_path)
+    _store(service, 0, MIN_VECTORS)
+    service.maybe_convert_to_ivf()
+    service.save_index_blocking()
+
+    reloaded = _service(tmp_path)
+    assert reloaded._is_ivf
+    index = reloaded.index
+    _store(reloaded, MIN_VECTORS, 10)
+    assert not reloaded.maybe_convert_to_ivf()
+    assert reloaded.index is index
+    assert isinstance(reloaded.metadata, FrameMetadataStore)
+    assert len(reloaded.metadata) == MIN_VECTORS + 10
+
+
+def test_memory_mapped_ivf_index_can_be_extended_and_saved(tmp_path, monkeypatch):
+    service = _service(tmp_path)
+    _store(service, 0, MIN_VECTORS)
+    service.maybe_convert_to_ivf()
+    service.save_index_blocking()
+
+    monkeypatch.setattr(faiss_service_module, "settings",
+                        faiss_service_module.settings.model_copy(update={"FAISS_MMAP_INDEX": True}))
+    mapped = _service(tmp_path)
+    _store(mapped, MIN_VECTORS, 10)
+    mapped.save_index_blocking()
+
+    reloaded = _service(tmp_path)
+    assert reloaded.index.ntotal == len(reloaded.metadata) == MIN_VECTORS + 10
+
+
+def test_save_snapshot_is_not_affected_by_later_stores(tmp_path, monkeypatch):
+    service = _service(tmp_path)
+    _store(service, 0, 20)
+
+    # Store more rows while the snapshot is being written, outside the index lock
+    real_dumps = faiss_service_module.orjson.dumps
+
+    def dumps_during_store(*args, **kwargs):
+        _store(service, 20, 5)
+        return real_dumps(*args, **kwargs)
+
+    monkeypatch.setattr(faiss_service_module.orjson, "dumps", dumps_during_store)
+    service.save_index_blocking()
+    monkeypatch.setattr(faiss_service_module.orjson, "dumps", real_dumps)
+
+    assert service.index.ntotal == len(service.metadata) == 25
+    reloaded = _service(tmp_path)
+    assert reloaded.index.ntotal == len(reloaded.metadata) == 20
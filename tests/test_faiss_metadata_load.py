@@ -0,0 +1,56 @@
+import orjson
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("transformers")
+
+from app.services.search.faiss_service import FAISSService
+from app.services.search.metadata_store import FrameMetadataStore
+
+RECORDS = [
+    {"frame_path": "frames/a_0.jpg", "video_name": "a.mp4", "timestamp": 0.0},
+    {"frame_path": "frames/a_1.jpg", "video_name": "a.mp4", "timestamp": 1.5},
+]
+
+
+def _service(index_dir):
+    # Only index_path is needed by _load_metadata; skip loading CLIP and the index
+    service = FAISSService.__new__(FAISSService)
+    service.index_path = index_dir
+    return service
+
+
+def _write(index_dir, payload):
+    (index_dir / "metadata.json").write_bytes(payload)
+
+
+def test_loads_columnar_metadata(tmp_path):
+    columns = FrameMetadataStore.from_records(RECORDS).to_columns()
+    _write(tmp_path, orjson.dumps(columns, option=orjson.OPT_SERIALIZE_NUMPY))
+
+    store = _service(tmp_path)._load_metadata()
+
+    assert store.to_records() == RECORDS
+
+
+def test_loads_legacy_record_list(tmp_path):
+    _write(tmp_path, orjson.dumps(RECORDS))
+
+    store = _service(tmp_path)._load_metadata()
+
+    assert store.to_records() == RECORDS
+
+
+def test_missing_file_gives_empty_store(tmp_path):
+    assert len(_service(tmp_path)._load_metadata()) == 0
+
+
+@pytest.mark.parametrize("payload", [
+    b"not json",
+    b"42",
+    orjson.dumps({"frame_path": ["a.jpg"], "video_name": ["a.mp4"]}),
+    orjson.dumps({"frame_path": ["a.jpg"], "video_name": [], "timestamp": [0.0]}),
+])
+def test_unusable_metadata_gives_empty_store(tmp_path, payload):
+    _write(tmp_path, payload)
+    assert len(_service(tmp_path)._load_metadata()) == 0
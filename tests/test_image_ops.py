@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from app.utils.image_ops import PerceptualHasher, _TimestampSampler
+
+
+@pytest.mark.parametrize("video_fps", [24.0, 25.0, 29.97, 30.0, 60.0])
+def test_sampler_keeps_target_rate(video_fps):
+    sampler = _TimestampSampler(fps=10)
+    frame_times = np.arange(int(video_fps * 10)) / video_fps  # 10 seconds of video
+    taken = [t for t in frame_times if sampler.take(t)]
+    assert abs(len(taken) - 100) <= 1
+    assert taken[0] == 0.0
+
+
+def test_sampler_takes_every_frame_below_target_rate():
+    sampler = _TimestampSampler(fps=10)
+    frame_times = np.arange(50) / 5.0
+    assert all(sampler.take(t) for t in frame_times)
+
+
+def test_sampler_restarts_after_gap():
+    sampler = _TimestampSampler(fps=1)
+    assert sampler.take(0.0)
+    assert sampler.take(10.0)
+    assert not sampler.take(10.5)
+    assert sampler.take(11.0)
+
+
+def test_perceptual_hash_is_stable_and_distinguishes_images():
+    hasher = PerceptualHasher()
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(120, 160, 3), dtype=np.uint8)
+    other = rng.integers(0, 256, size=(120, 160, 3), dtype=np.uint8)
+
+    assert hasher(image) == hasher(image.copy())
+    assert bin(int(hasher(image) ^ hasher(other))).count("1") > 5
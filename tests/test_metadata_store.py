@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from app.services.search.metadata_store import FrameMetadataStore
+
+
+def _records(n):
+    return [
+        {"frame_path": f"frames/v_{i}.jpg", "video_name": f"video{i % 2}.mp4", "timestamp": i * 0.5}
+        for i in range(n)
+    ]
+
+
+def test_records_round_trip():
+    records = _records(5)
+    store = FrameMetadataStore.from_records(records)
+    assert len(store) == 5
+    assert store.to_records() == records
+    assert store.record(3) == records[3]
+
+
+def test_columns_round_trip():
+    store = FrameMetadataStore.from_records(_records(4))
+    columns = store.to_columns()
+    assert set(columns) == set(FrameMetadataStore.COLUMN_NAMES)
+
+    restored = FrameMetadataStore.from_columns({
+        "frame_path": list(columns["frame_path"]),
+        "video_name": list(columns["video_name"]),
+        "timestamp": columns["timestamp"].tolist(),
+    })
+    assert restored.to_records() == store.to_records()
+
+
+def test_extend_grows_past_initial_capacity():
+    n = FrameMetadataStore.INITIAL_CAPACITY + 10
+    store = FrameMetadataStore()
+    store.extend(_records(n // 2))
+    store.extend(_records(n - n // 2))
+    assert len(store) == n
+    assert store.record(n - 1)["timestamp"] == (n - n // 2 - 1) * 0.5
+
+
+def test_extend_columns_rejects_mismatched_lengths():
+    store = FrameMetadataStore()
+    with pytest.raises(ValueError):
+        store.extend_columns(["a.jpg", "b.jpg"], ["v.mp4"], [0.0, 1.0])
+    assert len(store) == 0
+
+
+def test_take_gathers_rows_with_extra_columns():
+    records = _records(6)
+    store = FrameMetadataStore.from_records(records)
+    indices = np.array([4, 0, 4])
+    scores = np.array([0.9, 0.5, 0.1], dtype=np.float32)
+
+    rows = store.take(indices, similarity=scores)
+
+    assert [row["frame_path"] for row in rows] == [records[i]["frame_path"] for i in indices]
+    assert [row["timestamp"] for row in rows] == [records[i]["timestamp"] for i in indices]
+    assert rows[0]["similarity"] == pytest.approx(0.9)
+
+
+def test_take_sees_rows_appended_after_previous_take():
+    store = FrameMetadataStore.from_records(_records(2))
+    store.take(np.array([0]))
+    store.extend(_records(3))
+    assert store.take(np.array([4]))[0]["frame_path"] == "frames/v_2.jpg"
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("transformers")
+
+from app.services.search.batcher import SearchBatcher
+from app.utils.error_handling import FAISSServiceError
+
+
+class _FakeService:
+    """Returns top_k ranked results per query and records each batched call."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def search_batch(self, queries, top_k):
+        self.calls.append((list(queries), top_k))
+        if self.fail:
+            raise RuntimeError("search failed")
+        return [{"results": [f"{query}-{rank}" for rank in range(top_k)]} for query in queries]
+
+
+def _run(service, requests, max_batch_size=8, max_latency_ms=50):
+    async def main():
+        batcher = SearchBatcher(service, max_batch_size, max_latency_ms)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                *(batcher.submit(query, top_k) for query, top_k in requests),
+                return_exceptions=True,
+            )
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_queries_share_one_search_and_are_sliced_to_their_top_k():
+    service = _FakeService()
+    results = _run(service, [("a", 2), ("b", 5), ("c", 1)])
+
+    assert service.calls == [(["a", "b", "c"], 5)]
+    assert results[0] == {"results": ["a-0", "a-1"]}
+    assert results[1] == {"results": [f"b-{rank}" for rank in range(5)]}
+    assert results[2] == {"results": ["c-0"]}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    service = _FakeService()
+    results = _run(service, [(str(i), 1) for i in range(5)], max_batch_size=2)
+
+    assert [len(queries) for queries, _ in service.calls] == [2, 2, 1]
+    assert [result["results"] for result in results] == [[f"{i}-0"] for i in range(5)]
+
+
+def test_search_errors_propagate_to_every_request():
+    results = _run(_FakeService(fail=True), [("a", 1), ("b", 1)])
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_submit_requires_running_batcher():
+    batcher = SearchBatcher(_FakeService(), 4, 10)
+    with pytest.raises(FAISSServiceError):
+        asyncio.run(batcher.submit("a", 1))
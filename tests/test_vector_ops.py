@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.utils import vector_ops
+from app.utils.vector_ops import dot_window, hamming_distances, normalize_rows_
+
+requires_numba = pytest.mark.skipif(not vector_ops.NUMBA_AVAILABLE, reason="numba not installed")
+
+
+def _matrix(rows, dim=64, seed=0):
+    return np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+
+
+def test_normalize_rows_only_touches_requested_range():
+    buf = _matrix(6)
+    buf[3] = 0.0
+    original = buf.copy()
+
+    normalize_rows_(buf, 1, 5)
+
+    np.testing.assert_array_equal(buf[[0, 5]], original[[0, 5]])
+    np.testing.assert_allclose(np.linalg.norm(buf[[1, 2, 4]], axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(buf[3], 0.0)
+
+
+@requires_numba
+def test_numba_normalize_matches_numpy():
+    buf = _matrix(8)
+    expected = buf / np.linalg.norm(buf, axis=1, keepdims=True)
+    vector_ops._normalize_rows_numba(buf, 0, buf.shape[0])
+    np.testing.assert_allclose(buf, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_dot_window_matches_matmul():
+    window = _matrix(10)
+    query = _matrix(1, seed=1)[0]
+    np.testing.assert_allclose(dot_window(query, window), window @ query, rtol=1e-5, atol=1e-5)
+
+
+@requires_numba
+def test_numba_dot_window_matches_numpy():
+    window = _matrix(16)
+    query = _matrix(1, seed=2)[0]
+    np.testing.assert_allclose(vector_ops._dot_window_numba(query, window), window @ query,
+                               rtol=1e-5, atol=1e-5)
+
+
+def test_hamming_distances_match_bit_count():
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, size=50, dtype=np.uint64) * np.uint64(2)
+    query = hashes[7]
+
+    expected = [bin(int(h) ^ int(query)).count("1") for h in hashes]
+
+    np.testing.assert_array_equal(hamming_distances(hashes, query), expected)
+    assert hamming_distances(hashes, query)[7] == 0